@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""
+Compare gt_many with the equivalent gt loop
+
+    python benchmarks/bench_gt.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from drf_util.utils import gt, gt_many  # noqa: E402
+
+OBJECTS = [
+    {
+        'id': index,
+        'title': f'Item {index}',
+        'owner': {'name': 'John', 'contacts': [{'email': 'john@example.com'}, {'email': 'doe@example.com'}]},
+        'tags': [{'name': 'first'}, {'name': 'second'}],
+        'meta': {'created': '2021-01-01', 'updated': '2021-01-02', 'version': index % 7},
+    }
+    for index in range(5000)
+]
+
+PATHS = [
+    'id', 'title', 'owner.name', 'owner.contacts.0.email', 'owner.contacts.*.email', 'tags.*.name',
+    'meta.created', 'meta.updated', 'meta.version', 'meta.missing',
+]
+
+
+def gt_loop():
+    return {path: [gt(obj, path) for obj in OBJECTS] for path in PATHS}
+
+
+def gt_many_columns():
+    return gt_many(OBJECTS, PATHS)
+
+
+def gt_many_rows():
+    return gt_many(OBJECTS, PATHS, rows=True)
+
+
+if __name__ == '__main__':
+    assert gt_loop() == gt_many_columns()
+
+    number = 10
+    for function in (gt_loop, gt_many_columns, gt_many_rows):
+        elapsed = timeit.timeit(function, number=number)
+        print(f'{function.__name__:<16} {elapsed / number * 1000:8.2f} ms per {len(OBJECTS)}x{len(PATHS)}')
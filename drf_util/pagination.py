@@ -1,36 +1,438 @@
+import base64
+import binascii
+import hashlib
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.core.cache import caches
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, DatabaseError
+from django.db.models import Count, QuerySet, Window
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
 from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
+from drf_util.exceptions import ValidationException
+from drf_util.utils import keyset_filter
+
 DEFAULT_PAGE = 1
+DEFAULT_COUNT_TIMEOUT = 60
+DEFAULT_COUNT_CAP = 10000
+DEFAULT_COUNT_THRESHOLD = 10000
+WINDOW_COUNT_ANNOTATION = '_pagination_count'
+COUNT_WORKERS = 4
+
+# shared by the requests, each worker keeps its own database connection between counts
+COUNT_EXECUTOR = ThreadPoolExecutor(max_workers=COUNT_WORKERS, thread_name_prefix='drf_util_count')
+
+
+def count_exact(queryset):
+    return queryset.count()
+
+
+def count_cached(queryset, timeout=DEFAULT_COUNT_TIMEOUT, cache='default'):
+    """
+    Count cached for timeout seconds, the key is built from the query SQL and its params
+    """
+    sql, params = queryset.order_by().query.sql_with_params()
+    digest = hashlib.md5(f'{queryset.db}:{sql}:{params!r}'.encode()).hexdigest()
+    key = f'drf_util:count:{digest}'
+
+    count = caches[cache].get(key)
+    if count is None:
+        count = queryset.count()
+        caches[cache].set(key, count, timeout)
+    return count
+
+
+def count_capped(queryset, cap=DEFAULT_COUNT_CAP):
+    """
+    Count at most cap + 1 rows, a result bigger than cap means "cap+"
+    """
+    return queryset.order_by()[:cap + 1].count()
+
+
+def count_estimated(queryset, threshold=DEFAULT_COUNT_THRESHOLD):
+    """
+    Count estimated by the PostgreSQL planner, small estimates and other databases use the exact count
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.count()
+
+    try:
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+    except (DatabaseError, TypeError, ValueError, KeyError, IndexError):
+        return queryset.count()
+
+    return estimate if estimate >= threshold else queryset.count()
+
+
+COUNT_STRATEGIES = {
+    'exact': count_exact,
+    'cached': count_cached,
+    'capped': count_capped,
+    'estimated': count_estimated,
+}
+
+
+def get_count(queryset, strategy='exact', options=None):
+    """
+    Count objects with a strategy name from COUNT_STRATEGIES or a callable(queryset, **options)
+    """
+    if not isinstance(queryset, QuerySet):
+        return len(queryset)
+
+    function = strategy if callable(strategy) else COUNT_STRATEGIES[strategy]
+    return function(queryset, **(options or {}))
+
+
+def display_count(count, strategy='exact', options=None):
+    cap = (options or {}).get('cap', DEFAULT_COUNT_CAP)
+    if strategy == 'capped' and count is not None and count > cap:
+        return f'{cap}+'
+    return count
+
+
+class CountPaginator(Paginator):
+    """
+    Django paginator with a pluggable count strategy, pages past an inexact count are returned empty
+    """
+
+    def __init__(self, object_list, per_page, count_strategy='exact', count_options=None, **kwargs):
+        self.count_strategy = count_strategy
+        self.count_options = count_options or {}
+        super().__init__(object_list, per_page, **kwargs)
+
+    @cached_property
+    def count(self):
+        return get_count(self.object_list, self.count_strategy, self.count_options)
+
+    @property
+    def display_count(self):
+        return display_count(self.count, self.count_strategy, self.count_options)
+
+    @property
+    def exact(self):
+        return self.count_strategy == 'exact' or not isinstance(self.object_list, QuerySet)
+
+    def validate_number(self, number):
+        if self.exact:
+            return super().validate_number(number)
+
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(_('That page number is not an integer'))
+        if number < 1:
+            raise EmptyPage(_('That page number is less than 1'))
+        return number
+
+    def page(self, number):
+        if self.exact:
+            return super().page(number)
+
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(self.object_list[bottom:bottom + self.per_page], number, self)
 
 
 class CustomPagination(PageNumberPagination):
     page = DEFAULT_PAGE
     page_size = 10
     page_size_query_param = 'per_page'
+    django_paginator_class = CountPaginator
+
+    # strategy name from COUNT_STRATEGIES or a callable, views can set pagination_count_strategy
+    count_strategy = 'exact'
+    count_options = {}
+    # run the count with the page query: 'window' adds COUNT(*) OVER() to the page query, 'thread' runs
+    # the count on another connection, views can set pagination_concurrent_count
+    concurrent_count = None
+
+    # keyset pagination, pages are addressed by opaque cursors instead of page numbers
+    cursor_mode = False
+    cursor_query_param = 'cursor'
+    cursor_count = False
+    invalid_cursor_message = _('Invalid cursor')
+    nullable_ordering_message = _('Ordering by "%s" is not supported, it may be null')
+
+    cursor_data = None
 
     def get_paginated_response(self, data):
         custom_paginator = dict(
-            count=self.page.paginator.count, # noqa
-            total_pages=self.page.paginator.num_pages, # noqa
+            count=self.display_count,
+            total_pages=self.num_pages,
             per_page=int(self.request.GET.get('per_page', self.page_size)),
             current_page=int(self.request.GET.get('page', DEFAULT_PAGE)), results=data
         )
+        if self.cursor_data is not None:
+            custom_paginator.update(
+                next_cursor=self.cursor_data['next_cursor'],
+                prev_cursor=self.cursor_data['prev_cursor'],
+            )
         return Response(custom_paginator)
 
     @property
     def count(self):
+        if self.cursor_data is not None:
+            return self.cursor_data['count']
+
         paginator = getattr(self.page, 'paginator', None)
         return paginator.count if paginator else None
 
+    @property
+    def display_count(self):
+        if self.cursor_data is not None:
+            return display_count(self.cursor_data['count'], *self.cursor_data['count_strategy'])
+
+        paginator = getattr(self.page, 'paginator', None)
+        return getattr(paginator, 'display_count', paginator.count) if paginator else None
+
     @property
     def num_pages(self):
+        """
+        Number of pages, None when the count is not exact
+        """
+        if self.cursor_data is not None:
+            count = self.cursor_data['count']
+            if count is None or self.cursor_data['count_strategy'][0] != 'exact':
+                return None
+            return max(math.ceil(count / self.cursor_data['page_size']), 1)
+
         paginator = getattr(self.page, 'paginator', None)
-        return paginator.num_pages if paginator else None
+        if not paginator or not getattr(paginator, 'exact', True):
+            return None
+        return paginator.num_pages
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_mode:
+            return self.paginate_cursor_queryset(queryset, request, view)
+
+        paginator_class = type(self).django_paginator_class
+        if issubclass(paginator_class, CountPaginator):
+            strategy, options = self.get_count_strategy(view)
+            self.django_paginator_class = partial(paginator_class, count_strategy=strategy, count_options=options)
+
+        mode = getattr(view, 'pagination_concurrent_count', self.concurrent_count)
+        if mode and isinstance(queryset, QuerySet) and \
+                request.query_params.get(self.page_query_param) not in self.last_page_strings:
+            return self.paginate_concurrent_queryset(queryset, request, mode)
 
-    def paginate_queryset(self, *args, **kwargs):
         try:
-            return super().paginate_queryset(*args, **kwargs)
+            return super().paginate_queryset(queryset, request, view)
         except NotFound as e:
             return list()
+
+    def paginate_concurrent_queryset(self, queryset, request, mode):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        try:
+            number = int(request.query_params.get(self.page_query_param) or DEFAULT_PAGE)
+            if number < 1:
+                raise ValueError
+        except ValueError:
+            return list()
+
+        bottom = (number - 1) * page_size
+        # values() rows, distinct and combined queries fall back to the thread mode
+        if mode == 'window' and queryset._fields is None and not queryset.query.distinct and \
+                not queryset.query.combinator:  # noqa
+            results, count = self.fetch_window_page(queryset, bottom, page_size)
+        else:
+            results, count = self.fetch_thread_page(queryset, bottom, page_size, paginator)
+
+        paginator.count = count
+        self.page = paginator._get_page(results, number, paginator)  # noqa
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+
+        return results
+
+    @staticmethod
+    def fetch_window_page(queryset, bottom, page_size):
+        """
+        Page rows with the total count, computed by COUNT(*) OVER() in the same query
+        """
+        results = list(queryset.annotate(**{WINDOW_COUNT_ANNOTATION: Window(Count('*'))})[bottom:bottom + page_size])
+        if not results:
+            # the window is empty past the last page
+            return results, queryset.count() if bottom else 0
+
+        count = None
+        for item in results:
+            count = item.__dict__.pop(WINDOW_COUNT_ANNOTATION)
+        return results, count
+
+    @staticmethod
+    def fetch_thread_page(queryset, bottom, page_size, paginator):
+        """
+        Page rows and the count of the paginator (with its strategy) queried at the same time on two connections,
+        the count runs in a COUNT_EXECUTOR worker outside the transaction of the request (ATOMIC_REQUESTS, TestCase)
+        """
+        def count():
+            connection = connections[queryset.db]
+            # like the request_finished handler, respect CONN_MAX_AGE and drop broken connections
+            connection.close_if_unusable_or_obsolete()
+            try:
+                return paginator.count
+            except Exception:
+                connection.close()
+                raise
+
+        future = COUNT_EXECUTOR.submit(count)
+        results = list(queryset[bottom:bottom + page_size])
+        return results, future.result()
+
+    def get_count_strategy(self, view=None):
+        return (
+            getattr(view, 'pagination_count_strategy', self.count_strategy),
+            getattr(view, 'pagination_count_options', self.count_options),
+        )
+
+    # cursor mode
+
+    def get_cursor_ordering(self, queryset, view=None):
+        """
+        Ordering of the queryset (set by the ordering filter or the view) with a pk tiebreak, keyset comparisons
+        can't step over NULL values so nullable fields are rejected
+        """
+        ordering = list(queryset.query.order_by) or getattr(view, 'ordering', None) or \
+            list(queryset.model._meta.ordering)  # noqa
+        if isinstance(ordering, str):
+            ordering = [ordering]
+
+        fields = []
+        for field in ordering:
+            if not isinstance(field, str) or field.lstrip('-') in ('pk', queryset.model._meta.pk.name):  # noqa
+                break
+            if self.get_ordering_field(queryset.model, field.lstrip('-'))[1]:
+                raise ValidationException({'ordering': [self.nullable_ordering_message % field.lstrip('-')]})
+            fields.append(field)
+
+        descending = fields[-1].startswith('-') if fields else False
+        return [*fields, '-pk' if descending else 'pk']
+
+    @staticmethod
+    def get_ordering_field(model, path):
+        """
+        Model field at the end of the path (with `__` relations) and whether the path can resolve to NULL,
+        unknown names (annotations, transforms) are (None, True)
+        """
+        if path == 'pk':
+            return model._meta.pk, False
+
+        field, nullable = None, False
+        for name in path.split('__'):
+            if model is None:
+                return None, True
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                return None, True
+            nullable = nullable or field.null or (field.is_relation and not field.concrete)
+            model = field.related_model
+        return field, nullable
+
+    @staticmethod
+    def get_cursor_value(obj, field):
+        name = field.lstrip('-')
+        if name == 'pk':
+            return obj.pk
+
+        *relations, name = name.split('__')
+        for relation in relations:
+            obj = getattr(obj, relation)
+            if obj is None:
+                return None
+
+        try:
+            name = obj._meta.get_field(name).attname  # noqa
+        except (AttributeError, FieldDoesNotExist):
+            pass
+        return getattr(obj, name)
+
+    def encode_cursor(self, obj, fields, reverse=False):
+        values = [self.get_cursor_value(obj, field) for field in fields]
+        data = json.dumps({'v': values, 'r': reverse}, cls=DjangoJSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, fields, model):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+            values, reverse = data['v'], bool(data['r'])
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise NotFound(self.invalid_cursor_message)
+
+        try:
+            values = [
+                self.get_ordering_field(model, field.lstrip('-'))[0].to_python(value)
+                for field, value in zip(fields, values)
+            ]
+        except (ValueError, TypeError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        # the ordering has no nullable fields, a null comes from a tampered cursor
+        if None in values:
+            raise NotFound(self.invalid_cursor_message)
+
+        return values, reverse
+
+    def get_cursor_count(self, queryset, view=None):
+        return get_count(queryset, *self.get_count_strategy(view)) if self.cursor_count else None
+
+    def paginate_cursor_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        fields = self.get_cursor_ordering(queryset, view)
+        cursor = self.decode_cursor(request, fields, queryset.model)
+        reverse = bool(cursor and cursor[1])
+
+        page_fields = [field[1:] if field.startswith('-') else f'-{field}' for field in fields] if reverse else fields
+        page_queryset = queryset.order_by(*page_fields)
+        if cursor:
+            page_queryset = page_queryset.filter(keyset_filter(page_fields, cursor[0]))
+
+        results = list(page_queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        has_next = True if reverse else has_more
+        has_prev = has_more if reverse else cursor is not None
+
+        self.cursor_data = {
+            'count': self.get_cursor_count(queryset, view),
+            'count_strategy': self.get_count_strategy(view),
+            'page_size': page_size,
+            'next_cursor': self.encode_cursor(results[-1], fields) if results and has_next else None,
+            'prev_cursor': self.encode_cursor(results[0], fields, reverse=True) if results and has_prev else None,
+        }
+        return results
+
+
+class CustomCursorPagination(CustomPagination):
+    cursor_mode = True
@@ -1,6 +1,6 @@
 import copy
 
-from django.core.paginator import Paginator, EmptyPage
+from django.core.paginator import EmptyPage
 from django.db.models import QuerySet
 from django.utils.translation import gettext as _
 from rest_framework import serializers
@@ -10,6 +10,7 @@ from varname import varname
 
 from drf_util.exceptions import ValidationException
 from drf_util.fields import PrimaryKeyRelatedField
+from drf_util.pagination import CountPaginator
 from drf_util.utils import any_value, add_related
 
 BASE_FIELDS = ['id', 'created_at', 'modified_at']
@@ -117,6 +118,10 @@ class PaginatorSerializer(serializers.Serializer):  # noqa
 
     default_per_page = 50
 
+    # strategy name from drf_util.pagination.COUNT_STRATEGIES or a callable
+    count_strategy = 'exact'
+    count_options = {}
+
     pagination_remove_fields = ['page', 'per_page']
 
     def get_original_fields(self):
@@ -153,7 +158,10 @@ class PaginatorSerializer(serializers.Serializer):  # noqa
         return skip
 
     def paginate_data(self, objects, per_page=None):
-        paginator = Paginator(objects, per_page if per_page else self.get_default_per_page())
+        paginator = CountPaginator(
+            objects, per_page if per_page else self.get_default_per_page(),
+            count_strategy=self.count_strategy, count_options=self.count_options
+        )
 
         page = self.get_page()
         try:
@@ -163,7 +171,7 @@ class PaginatorSerializer(serializers.Serializer):  # noqa
                 'page': [_('Page must be less than or equal to %s') % paginator.num_pages]
             })
 
-        return data.object_list, data.paginator.count
+        return data.object_list, data.paginator.display_count
 
 
 class StringListField(serializers.ListField):
@@ -1,10 +1,21 @@
 import glob
+import json
+import os
+import re
 import sys
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime
+from fnmatch import fnmatch
+from functools import lru_cache
 from typing import Any
 
 from dateutil import parser
-from django.db.models import QuerySet, ForeignKey, ManyToManyField
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import QuerySet, Q, Prefetch
+from django.db.models.query import ModelIterable
 from django.db.models import TextChoices
+from rest_framework.relations import RelatedField
 from rest_framework.serializers import Serializer
 
 
@@ -20,22 +31,21 @@ class Colors(TextChoices):
     UNDERLINE = '\033[4m'
 
 
+MISSING = type('Missing', (), {'__repr__': lambda self: 'MISSING', '__bool__': lambda self: False})()
+
+
 def dict_merge(a, b, path=None):
-    if path is None:
-        path = []
-
-    for key in b:
-        if key in a:
-            if isinstance(a[key], dict) and isinstance(b[key], dict):
-                dict_merge(a[key], b[key], path + [str(key)])
-            elif a[key] == b[key]:
-                pass  # same leaf value
+    stack = [(a, b)]
+
+    while stack:
+        a_item, b_item = stack.pop()
+        for key in b_item:
+            if key in a_item:
+                if isinstance(a_item[key], dict) and isinstance(b_item[key], dict):
+                    stack.append((a_item[key], b_item[key]))
+                # on conflict the value of a is kept
             else:
-                pass
-                # a[key] = b[key]
-                # raise Exception('Conflict at %s' % '.'.join(path + [str(key)]))
-        else:
-            a[key] = b[key]
+                a_item[key] = b_item[key]
 
     return a
 
@@ -44,32 +54,191 @@ def dict_diff(a, b):
     data_a = {}
     data_b = {}
 
-    for key in a:
-        a_value = a.get(key)
-        b_value = b.get(key)
-        if isinstance(a_value, dict) and isinstance(b_value, dict):
-            a_value, b_value = dict_diff(a_value, b_value)
-
-        if a_value != b_value:
-            data_a[key] = a_value
-            data_b[key] = b_value
+    # frames: (a, b, diff a, diff b, keys, parent diff a, parent diff b, key in parent)
+    stack = [(a, b, data_a, data_b, iter(a), None, None, None)]
+    while stack:
+        a_item, b_item, diff_a, diff_b, keys, parent_a, parent_b, parent_key = stack[-1]
+
+        for key in keys:
+            a_value = a_item.get(key)
+            b_value = b_item.get(key)
+            if isinstance(a_value, dict) and isinstance(b_value, dict):
+                stack.append((a_value, b_value, {}, {}, iter(a_value), diff_a, diff_b, key))
+                break
+
+            if a_value != b_value:
+                diff_a[key] = a_value
+                diff_b[key] = b_value
+        else:
+            stack.pop()
+            if parent_a is not None and diff_a != diff_b:
+                parent_a[parent_key] = diff_a
+                parent_b[parent_key] = diff_b
 
     return data_a, data_b
 
 
+def dict_diff_patch(a: dict, b: dict) -> list:
+    """
+    Function that compares two dicts and returns only the changed leaves, unchanged subtrees are not copied
+    :param a: Old dict
+    :param b: New dict
+    :return: List of (path, old value, new value), path is a tuple of keys and MISSING marks an absent key
+    """
+    patch = []
+    stack = [((), a, b)]
+
+    while stack:
+        path, a_item, b_item = stack.pop()
+
+        for key in a_item:
+            a_value = a_item[key]
+            b_value = b_item.get(key, MISSING)
+            if isinstance(a_value, dict) and isinstance(b_value, dict):
+                stack.append((path + (key,), a_value, b_value))
+            elif b_value is MISSING or a_value != b_value:
+                patch.append((path + (key,), a_value, b_value))
+
+        for key in b_item:
+            if key not in a_item:
+                patch.append((path + (key,), MISSING, b_item[key]))
+
+    return patch
+
+
+def dict_apply_patch(data: dict, patch: list, reverse=False) -> dict:
+    """
+    Function that applies a patch made by dict_diff_patch, data is changed in place
+    :param data: Dict we are patching
+    :param patch: List of (path, old value, new value)
+    :param reverse: Apply old values instead of new ones (undo the patch)
+    :return: Patched data
+    """
+    for path, old, new in patch:
+        value = old if reverse else new
+        *parents, key = path
+
+        item = data
+        for parent in parents:
+            if not isinstance(item.get(parent), dict):
+                item[parent] = {}
+            item = item[parent]
+
+        if value is MISSING:
+            item.pop(key, None)
+        else:
+            item[key] = value
+
+    return data
+
+
 def dict_normalise(data: dict, separator='__') -> dict:
     new_dict = {}
 
-    for key, value in data.items():
-        if isinstance(value, dict):
-            for embedded_key, embedded_value in dict_normalise(value, separator).items():
-                new_dict.update({separator.join((key, embedded_key)): embedded_value})
+    stack = [(None, iter(data.items()))]
+    while stack:
+        prefix, items = stack[-1]
+
+        for key, value in items:
+            if prefix is not None:
+                key = separator.join((prefix, key))
+
+            if isinstance(value, dict):
+                stack.append((key, iter(value.items())))
+                break
+
+            new_dict[key] = value
         else:
-            new_dict.update({key: value})
+            stack.pop()
 
     return new_dict
 
 
+def dict_unnormalise(data: dict, separator='__') -> dict:
+    """
+    Inverse of dict_normalise, {'a__b': 1, 'a__c': 2} -> {'a': {'b': 1, 'c': 2}}
+    """
+    return st_many(data, sep=separator, indexes=False)
+
+
+_BAD_INDEX = object()
+
+
+class PathAccessor:
+    """
+    Reusable accessor for a `gt` path, the path is split only once at compile time
+    """
+    __slots__ = ('path', 'sep', 'steps', 'has_wildcard')
+
+    def __init__(self, path: str, sep: str = '.'):
+        self.path = path
+        self.sep = sep
+        self.steps = tuple((key, self._parse_index(key)) for key in path.split(sep))
+        self.has_wildcard = any(key == '*' for key, _ in self.steps)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.path!r}, sep={self.sep!r})'
+
+    @staticmethod
+    def _parse_index(key):
+        if not key.isdigit():
+            return None
+
+        try:
+            return int(key)
+        except ValueError:
+            # unicode digits like "²" can't be used as index, lookup must fail
+            return _BAD_INDEX
+
+    @staticmethod
+    def _get_item(obj, key, index):
+        if hasattr(obj, '__getitem__'):
+            return obj.__getitem__(key if index is None else index)
+
+        return getattr(obj, key)
+
+    def __call__(self, obj: object, default: Any = None) -> Any:
+        if not self.has_wildcard:
+            try:
+                for key, index in self.steps:
+                    if hasattr(obj, '__getitem__'):
+                        obj = obj.__getitem__(key if index is None else index)
+                    else:
+                        obj = getattr(obj, key)
+            except Exception:
+                return default
+
+            return obj
+
+        get_item = self._get_item
+
+        objects = [obj]
+        try:
+            for key, index in self.steps:
+                if key == '*':
+                    objects = [item for _obj in objects for item in _obj]
+                else:
+                    objects = [get_item(_obj, key, index) for _obj in objects]
+        except Exception:
+            return default
+
+        if len(objects) <= 1:
+            return objects[0] if objects else default
+
+        return objects
+
+
+@lru_cache(maxsize=1024)
+def compile_path(path: str, sep: str = '.') -> PathAccessor:
+    """
+    Function that compiles a path into a cached accessor which can be reused for many objects
+    :param path: Path we are trying to search for, same as in gt
+    :param sep: Separator used between path values
+    :return: PathAccessor, call it with (obj, default) to extract the value
+    """
+    return PathAccessor(path, sep)
+
+
 def gt(obj: object, path: str, default: Any = None, sep: str = '.') -> Any:
     """
     Function that extracts the value from the specified path in obj and returns default if nothing found
@@ -79,43 +248,38 @@ def gt(obj: object, path: str, default: Any = None, sep: str = '.') -> Any:
     :param sep: Separator used between path values
     :return: Value in obj path if it exists or default value
     """
-
-    def _dispatch_item(_obj, _key):
-        if _key == '*':
-            for item in _obj:
-                yield item
-
-        elif hasattr(_obj, '__getitem__'):
-            if _key.isdigit():
-                yield _obj.__getitem__(int(_key))
-            else:
-                yield _obj.__getitem__(_key)
-
-        else:
-            yield getattr(_obj, _key)
-
-    def _dispatch_list(_gen, _key):
-        for _obj in _gen:
-            for item in _dispatch_item(_obj, _key):
-                yield item
-
-    obj = [obj]
-
     if not isinstance(path, str):
         return default
 
-    for key in path.split(sep):
-        obj = _dispatch_list(obj, key)
+    return compile_path(path, sep)(obj, default)
 
-    try:
-        obj = list(obj)
-    except Exception:
-        return default
 
-    if len(obj) <= 1:
-        obj = next(iter(obj), default)
+def gt_many(objects, paths, default: Any = None, sep: str = '.', rows: bool = False):
+    """
+    Function that extracts many paths from many objects in a single pass, every path is compiled once
+    :param objects: Iterable of objects we are searching for values in
+    :param paths: Paths we are trying to search for in every object
+    :param default: Default value we return if nothing found in a path
+    :param sep: Separator used between path values
+    :param rows: Return a list of tuples (one per object) instead of columns
+    :return: Dict of path -> list of values, or list of row tuples if rows is True
+    """
+    paths = list(paths)
+    accessors = [
+        compile_path(path, sep) if isinstance(path, str) else lambda _obj, _default: _default
+        for path in paths
+    ]
 
-    return obj
+    if rows:
+        return [tuple([accessor(obj, default) for accessor in accessors]) for obj in objects]
+
+    columns = [[] for _ in accessors]
+    pairs = list(zip(accessors, [column.append for column in columns]))
+    for obj in objects:
+        for accessor, append in pairs:
+            append(accessor(obj, default))
+
+    return dict(zip(paths, columns))
 
 
 def sf(function, exception=Exception):
@@ -130,49 +294,194 @@ def join_url(part_one: str, part_two: str):
 
 
 def st(path, value):
-    dict_return = {}
-    parts = path.split('.')
     if not path:
         return value
-    key = parts.pop(0)
-    dict_return[key] = st(".".join(parts), value)
-    return dict_return
 
+    parts = path.split('.')
+    if len(parts) > 1 and not parts[-1]:
+        parts.pop()
+
+    for key in reversed(parts):
+        value = {key: value}
 
-def get_object_labels(obj, names=None):
-    labels = []
-    iterate = []
-
-    if isinstance(obj, dict):
-        iterate = obj.items()
-    elif isinstance(obj, list):
-        iterate = enumerate(obj)
-
-    for key, value in iterate:
-        if isinstance(value, str):
-            if names:
-                if key in names:
-                    labels.append(value)
-            else:
-                labels.append(value)
+    return value
+
+
+def _set_item(container, key, value):
+    if isinstance(container, list):
+        index = int(key)
+        if index >= len(container):
+            container.extend([None] * (index + 1 - len(container)))
+        container[index] = value
+    else:
+        container[key] = value
+
+
+def _get_item(container, key):
+    if isinstance(container, list):
+        index = int(key)
+        return container[index] if index < len(container) else None
+    return container.get(key)
+
+
+def st_many(items: dict, sep: str = '.', indexes: bool = True) -> dict:
+    """
+    Function that builds one nested dict from many paths, intermediate dicts are shared
+    :param items: Dict of path -> value, like {'a.b': 1, 'a.c.0': 2}
+    :param sep: Separator used between path values
+    :param indexes: Digit keys create lists, {'a.1': 2} -> {'a': [None, 2]}, a container with digit and other keys
+        stays a dict, {'a.0': 1, 'a.b': 2} -> {'a': {'0': 1, 'b': 2}}
+    :return: Nested dict
+    """
+    result = {}
+    paths = {path: path.split(sep) for path in items}
+
+    # containers which have a non digit key can't be lists
+    named = {
+        tuple(keys[:depth]) for keys in paths.values() for depth in range(1, len(keys)) if not keys[depth].isdigit()
+    } if indexes else set()
+
+    for path, value in items.items():
+        keys = paths[path]
+
+        container = result
+        for depth, (key, next_key) in enumerate(zip(keys, keys[1:]), 1):
+            child = _get_item(container, key)
+            is_list = indexes and next_key.isdigit() and tuple(keys[:depth]) not in named
+            container_type = list if is_list else dict
+            if not isinstance(child, container_type):
+                # a value set by a shorter path is replaced by the container
+                child = container_type()
+                _set_item(container, key, child)
+            container = child
+
+        _set_item(container, keys[-1], value)
+
+    return result
+
+
+def iter_object_labels(obj, names=None, unique=True):
+    """
+    Generator version of get_object_labels, the object is walked with an explicit stack so deep documents
+    don't hit the recursion limit
+    :param obj: Dict or list we are searching for string values in
+    :param names: Keys (or list indexes) of the values we are looking for, all string values if not set
+    :param unique: Yield every label only once
+    :return: Generator of labels
+    """
+    seen = set()
+    stack = [obj]
+
+    while stack:
+        current = stack.pop()
+
+        if isinstance(current, dict):
+            iterate = current.items()
+        elif isinstance(current, list):
+            iterate = enumerate(current)
         else:
-            labels = labels + get_object_labels(value, names)
+            continue
+
+        for key, value in iterate:
+            if isinstance(value, str):
+                if names and key not in names:
+                    continue
+                if unique:
+                    if value in seen:
+                        continue
+                    seen.add(value)
+                yield value
+            elif isinstance(value, (dict, list)):
+                stack.append(value)
+
+
+def get_object_labels(obj, names=None):
+    return list(set(iter_object_labels(obj, names, unique=False)))
+
+
+def get_keyset_field(queryset):
+    """
+    Function that detects the unique field a queryset can be walked by with keyset pagination
+    :param queryset: QuerySet ordered by a single unique field, or not ordered at all (pk is used)
+    :return: Tuple (field name, attribute name, descending) or None if keyset can't be used
+    """
+    if not isinstance(queryset, QuerySet) or queryset.query.is_sliced or queryset.query.distinct_fields:
+        return None
+
+    if queryset._iterable_class is not ModelIterable:  # noqa
+        return None
+
+    ordering = list(queryset.query.order_by)
+    if not ordering and queryset.query.default_ordering:
+        ordering = list(queryset.model._meta.ordering)  # noqa
 
-    return list(set(labels))
+    if len(ordering) > 1 or (ordering and not isinstance(ordering[0], str)):
+        return None
+
+    name = ordering[0] if ordering else 'pk'
+    descending = name.startswith('-')
+    name = name.lstrip('-')
+
+    opts = queryset.model._meta  # noqa
+    if name == 'pk':
+        return name, opts.pk.attname, descending
+
+    try:
+        field = opts.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+    if not field.concrete or field.null or not (field.unique or field.primary_key):
+        return None
+
+    return name, field.attname, descending
 
 
-def fetch_objects(instance, function, select=50):
+def fetch_objects(instance, function=None, select=50, function_batch=None, keyset=True):
+    """
+    Function that walks a big queryset by chunks and calls function for every object
+    :param instance: QuerySet (or any sliceable) we are walking
+    :param function: Function called with every object
+    :param select: Size of one chunk
+    :param function_batch: Function called with the list of objects of every chunk
+    :param keyset: Use keyset pagination (WHERE key > last) when the queryset is ordered by a unique field,
+        offset slicing is used as fallback
+    """
+    keyset_field = get_keyset_field(instance) if keyset else None
+
+    if keyset_field:
+        name, attname, descending = keyset_field
+        lookup = f'{name}__lt' if descending else f'{name}__gt'
+        queryset = instance.order_by(f'-{name}' if descending else name)
+
+        def get_chunk(_last):
+            if _last is None:
+                return list(queryset[:select])
+            return list(queryset.filter(**{lookup: getattr(_last, attname)})[:select])
+    else:
+        def get_chunk(_last):
+            return list(instance[skip:skip + select])
+
     skip = 0
+    last = None
     while True:
-        objects = list(instance[skip:skip + select])
+        objects = get_chunk(last)
 
         if len(objects) == 0:
             break
 
         skip += select
+        last = objects[-1]
 
-        for obj in objects:
-            function(obj)
+        if function_batch:
+            function_batch(objects)
+
+        if function:
+            for obj in objects:
+                function(obj)
+
+        if len(objects) < select:
+            break
 
 
 def offset_objects(key, get_function, save_function, storage):
@@ -188,21 +497,122 @@ def offset_objects(key, get_function, save_function, storage):
         storage.put(key, offset)
 
 
-def date(item):
+def offset_objects_pipeline(key, get_function, save_function=None, storage=None, workers=4, processes=False,
+                            max_pages=2, save_batch_function=None, item_key='ocid'):
+    """
+    Parallel version of offset_objects, the next page is fetched while the current one is being saved
+    and the offset is stored only when every item before it was saved
+    :param key: Storage key of the offset
+    :param get_function: Function (offset) -> (objects, next offset)
+    :param save_function: Function called with every item, runs in the pool
+    :param storage: Object with get(key) and put(key, value) methods
+    :param workers: Size of the save pool
+    :param processes: Use a process pool instead of a thread pool (functions must be picklable)
+    :param max_pages: Max pages being saved at the same time
+    :param save_batch_function: Function called with the list of items of a page, instead of save_function
+    :param item_key: Key of the item passed to save functions, None to pass the whole object
+    """
+    assert save_function or save_batch_function, 'save_function or save_batch_function is required'
+
+    pool_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    pending = deque()
+
+    def checkpoint(limit):
+        # store offsets of finished pages in order, wait while more than limit pages are in flight
+        while pending:
+            page_offset, futures = pending[0]
+            if len(pending) <= limit and not all(future.done() for future in futures):
+                break
+
+            for future in futures:
+                future.result()
+
+            pending.popleft()
+            storage.put(key, page_offset)
+
+    with ThreadPoolExecutor(max_workers=1) as fetcher, pool_class(max_workers=workers) as pool:
+        next_page = fetcher.submit(get_function, storage.get(key))
+
+        try:
+            while True:
+                objects, offset = next_page.result()
+                if not objects:
+                    break
+
+                next_page = fetcher.submit(get_function, offset)
+                checkpoint(max_pages - 1)
+
+                items = [object_data[item_key] for object_data in objects] if item_key else list(objects)
+                if save_batch_function:
+                    futures = [pool.submit(save_batch_function, items)]
+                else:
+                    futures = [pool.submit(save_function, item) for item in items]
+
+                pending.append((offset, futures))
+        except Exception:
+            # store the offsets of pages saved before the failure, a restart doesn't redo them
+            try:
+                checkpoint(0)
+            except Exception:
+                pass
+            raise
+
+        checkpoint(0)
+
+
+ISO_DATETIME_RE = re.compile(
+    r'\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d{1,6})?)?(?:Z|[+-]\d{2}:?\d{2})?)?$'
+)
+
+
+def parse_date(item, ignoretz=False):
+    """
+    Function that parses a date string, ISO 8601 strings are parsed with datetime.fromisoformat,
+    other formats fall back to dateutil
+    :param item: String we are parsing
+    :param ignoretz: Drop the timezone of the result
+    :return: datetime
+    """
+    if isinstance(item, str) and ISO_DATETIME_RE.match(item):
+        try:
+            value = datetime.fromisoformat(item)
+        except ValueError:
+            # old python versions don't support "Z" and all fraction lengths
+            pass
+        else:
+            return value.replace(tzinfo=None) if ignoretz else value
+
+    return parser.parse(item, ignoretz=ignoretz)
+
+
+def _ignoretz():
     from django.conf import settings
 
+    return not getattr(settings, 'USE_TZ', False)
+
+
+def date(item):
     try:
-        return parser.parse(item, ignoretz=not getattr(settings, 'USE_TZ', False))
+        return parse_date(item, ignoretz=_ignoretz())
     except TypeError:
         return None
 
 
-def to_dt(items):
-    from django.conf import settings
+def to_dt(items, copy=False):
+    """
+    Function that parses every non empty item of items to datetime
+    :param items: List of date strings, it is changed in place, or any iterable
+    :param copy: Return a new list and don't change items
+    :return: List of datetime
+    """
+    ignoretz = _ignoretz()
+
+    if copy or not isinstance(items, list):
+        return [parse_date(item, ignoretz=ignoretz) if item else item for item in items]
 
     for k, item in enumerate(items):
         if item:
-            items[k] = parser.parse(item, ignoretz=not getattr(settings, 'USE_TZ', False))
+            items[k] = parse_date(item, ignoretz=ignoretz)
 
     return items
 
@@ -227,33 +637,264 @@ def any_value(items: list):
             return item
 
 
-def iterate_query(queryset, offset_field='pk', offset_start=0, limit=100):
+def keyset_filter(fields, values) -> Q:
+    """
+    Function that builds the row-value comparison (f1, f2, ...) > (v1, v2, ...) as a portable Q object,
+    fields prefixed with "-" are compared descending
+    :param fields: Ordering fields, like ['created_at', 'pk']
+    :param values: Values of the last fetched row, in the same order
+    :return: Q object that selects rows placed after the given values
+    """
+    query = Q()
+    equal = {}
+
+    for field, value in zip(fields, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        query |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+
+    # leading range lets the database use the index on the first column
+    first = fields[0]
+    first_lookup = 'lte' if first.startswith('-') else 'gte'
+    return Q(**{f'{first.lstrip("-")}__{first_lookup}': values[0]}) & query
+
+
+def iterate_query(queryset, offset_field='pk', offset_start=0, limit=100, cursor=False, values_list=None,
+                  only=None):
+    """
+    Function that iterates a big queryset by chunks using keyset pagination
+    :param queryset: QuerySet we are iterating
+    :param offset_field: Field, or list of fields like ('created_at', 'pk'), the queryset is ordered by,
+        the last field must make the ordering unique, prefix a field with "-" for descending order
+    :param offset_start: Value (tuple of values for many fields) to start after, None to start from the beginning
+    :param limit: Size of one chunk
+    :param cursor: Stream a single query through a server-side cursor (.iterator(chunk_size=limit))
+        instead of running one query per chunk
+    :param values_list: Fetch only these fields and yield tuples instead of model instances
+    :param only: Fetch model instances with only these fields loaded
+    :return: Generator of objects
+    """
+    composite = not isinstance(offset_field, str)
+    fields = list(offset_field) if composite else [offset_field]
+    names = [field.lstrip('-') for field in fields]
+
+    if composite and not isinstance(offset_start, (list, tuple)):
+        offset_start = None
+    elif not composite and offset_start is not None:
+        offset_start = (offset_start,)
+
+    queryset = queryset.order_by(*fields)
+
+    if values_list:
+        values_list = list(values_list)
+        queryset = queryset.values_list(*values_list, *[name for name in names if name not in values_list])
+        positions = [(values_list + [n for n in names if n not in values_list]).index(name) for name in names]
+        size = len(values_list)
+
+        def get_offset(_row):
+            return tuple(_row[position] for position in positions)
+
+        def get_item(_row):
+            return _row[:size] if len(_row) > size else _row
+    else:
+        if only:
+            queryset = queryset.only(*only, *[name for name in names if name not in only])
+
+        opts = queryset.model._meta  # noqa
+        attnames = []
+        for name in names:
+            try:
+                attnames.append(opts.get_field(name).attname)
+            except FieldDoesNotExist:
+                attnames.append(name)
+
+        def get_offset(_obj):
+            return tuple(getattr(_obj, attname) for attname in attnames)
+
+        def get_item(_obj):
+            return _obj
+
+    if cursor:
+        if offset_start is not None:
+            queryset = queryset.filter(keyset_filter(fields, offset_start))
+
+        for obj in queryset.iterator(chunk_size=limit):
+            yield get_item(obj)
+        return
+
     while True:
-        object_list = list(queryset.filter(**{offset_field + "__gt": offset_start}).order_by(offset_field)[:limit])
+        chunk = queryset if offset_start is None else queryset.filter(keyset_filter(fields, offset_start))
+        object_list = list(chunk[:limit])
         if not len(object_list):
             break
 
+        offset_start = get_offset(object_list[-1])
         for obj in object_list:
-            offset_start = getattr(obj, offset_field)
-            yield obj
+            yield get_item(obj)
+
+        if len(object_list) < limit:
+            break
+
+
+APPLICATIONS_MANIFEST_ENV = 'APPLICATIONS_MANIFEST'
+_applications = {}
+
+
+def _scan_applications(base_folder, inside_file):
+    """
+    List (application folder, file) pairs matching "base_folder/[!_]*/inside_file*", like glob did, the file
+    is a "/" separated path inside the application folder
+    """
+    pattern = inside_file + '*' if inside_file else None
+    found = []
+
+    if pattern and ('/' in pattern or os.sep in pattern):
+        # patterns with folders keep the glob semantics
+        for path in sorted(glob.glob(os.path.join(base_folder, '[!_]*', pattern), recursive=True)):
+            folder, *names = os.path.relpath(path, base_folder).split(os.sep)
+            found.append((folder, '/'.join(names)))
+        return found
+
+    try:
+        with os.scandir(base_folder) as entries:
+            folders = sorted(entry.name for entry in entries if entry.name[0] not in '_.' and entry.is_dir())
+    except OSError:
+        return found
+
+    for folder in folders:
+        if pattern is None:
+            found.append((folder, ''))
+            continue
+
+        try:
+            with os.scandir(os.path.join(base_folder, folder)) as entries:
+                names = sorted(
+                    entry.name for entry in entries
+                    if (not entry.name.startswith('.') or pattern.startswith('.')) and fnmatch(entry.name, pattern)
+                )
+        except OSError:
+            continue
+
+        found.extend((folder, name) for name in names)
+
+    return found
+
+
+def load_applications_manifest(path=None):
+    """
+    Function that fills the get_applications cache from a manifest written by write_applications_manifest,
+    so the filesystem is not scanned
+    :param path: Path to the manifest, APPLICATIONS_MANIFEST environment variable is used if not set
+    """
+    path = path or os.environ.get(APPLICATIONS_MANIFEST_ENV)
+    if not path:
+        return
+
+    try:
+        with open(path) as manifest:
+            items = json.load(manifest)
+    except FileNotFoundError:
+        # a missing manifest means no manifest, get_applications scans the filesystem
+        return
+
+    for item in items:
+        _applications[(item['base_folder'], item['inside_file'])] = [tuple(pair) for pair in item['found']]
+
+
+def write_applications_manifest(path, queries=None):
+    """
+    Function that writes found applications to a manifest file, run it at build time
+    :param path: Path to the manifest
+    :param queries: List of (base_folder, inside_file) to scan, all cached results are written if not set
+    """
+    for base_folder, inside_file in queries or ():
+        _applications[(base_folder, inside_file)] = _scan_applications(base_folder, inside_file)
+
+    with open(path, 'w') as manifest:
+        json.dump([
+            {'base_folder': base_folder, 'inside_file': inside_file, 'found': found}
+            for (base_folder, inside_file), found in _applications.items()
+        ], manifest, indent=2)
+
+
+def clear_applications_cache():
+    _applications.clear()
 
 
 def get_applications(base_folder='apps', inside_file='', only_directory=True, join_character='.'):
-    if inside_file:
-        inside_file += '*'
+    key = (base_folder, inside_file)
 
-    separator = '\\' if sys.platform.startswith('win') else '/'
+    if not _applications and os.environ.get(APPLICATIONS_MANIFEST_ENV):
+        load_applications_manifest()
+
+    found = _applications.get(key)
+    if found is None:
+        found = _applications[key] = _scan_applications(base_folder, inside_file)
+
+    separator = '[/\\\\]' if sys.platform.startswith('win') else '/'
+    base_parts = [part for part in re.split(separator, base_folder) if part]
+
+    apps = []
+    for folder, name in found:
+        parts = [*base_parts, folder, *name.split('/')]
+        apps.append(join_character.join(parts[:-1] if only_directory else parts).replace('.py', ''))
 
-    apps = [
-        join_character.join(directory.split(separator)[:-1 if only_directory else None]).replace('.py', '')
-        for directory in glob.glob(f"{base_folder}/[!_]*/{inside_file}", recursive=True)
-    ]
     return apps
 
 
-def get_related(serializer, model=None, upper_field='', deep=3):
+@lru_cache(maxsize=None)
+def get_model_relations(model) -> dict:
+    """
+    Function that maps the attribute names of model relations to their fields, reverse relations are
+    mapped by accessor name (like "things" or "thing_set")
+    """
+    relations = {}
+    for field in model._meta.get_fields(include_hidden=False):  # noqa
+        if not field.is_relation or field.related_model is None:
+            continue
+        name = field.get_accessor_name() if field.auto_created and not field.concrete else field.name
+        if name:
+            relations[name] = field
+    return relations
+
+
+def _walk_relations(model, attrs, path, many, prefetch_related, select_related):
+    """
+    Add a lookup for every relation in attrs, to-many relations and everything under them are prefetched
+    :return: Tuple (model, path, many) of the last relation or None if attrs don't end with a relation
+    """
+    for attr in attrs:
+        field = get_model_relations(model).get(attr)
+        if field is None:
+            return None
+
+        path = '__'.join((path, attr)) if path else attr
+        many = many or field.one_to_many or field.many_to_many
+        lookups = prefetch_related if many else select_related
+        if path not in lookups:
+            lookups.append(path)
+
+        model = field.related_model
+
+    return model, path, many
+
+
+def get_related(serializer, model=None, upper_field='', deep=3, many=False):
+    """
+    Function that finds relations used by serializer: forward and reverse foreign keys, one to one and
+    many to many fields, nested serializers (also many=True) and dotted sources. Relations used by
+    SerializerMethodField can be declared in serializer Meta.prefetch_hints, like ['things__other_things']
+    :param serializer: Serializer class or instance
+    :param model: Model of the serializer, taken from serializer Meta if not set
+    :param upper_field: Lookup of the serializer relation, used for nested serializers
+    :param deep: Max depth of nested serializers
+    :param many: Serializer is nested under a to-many relation, so all relations must be prefetched
+    :return: Tuple (prefetch_related, select_related) of lookups
+    """
     prefetch_related, select_related = [], []
 
+    serializer = getattr(serializer, 'child', serializer)
     if not isinstance(serializer, Serializer):
         serializer = serializer()
 
@@ -261,36 +902,393 @@ def get_related(serializer, model=None, upper_field='', deep=3):
         serializer_meta = getattr(serializer, 'Meta', None)
         model = getattr(serializer_meta, 'model', None)
 
-    for field_name, field_data in serializer.fields.items():
-        field_name = getattr(field_data, 'source', field_data)
-        if upper_field:
-            field_name = '__'.join((upper_field, field_name))
+    if model is None:
+        return prefetch_related, select_related
 
-        field = gt(model, field_data.source, None)
+    for hint in getattr(getattr(serializer, 'Meta', None), 'prefetch_hints', ()):
+        _walk_relations(model, hint.split('__'), upper_field, many, prefetch_related, select_related)
 
-        if not field or not hasattr(field, 'field'):
+    for field_data in serializer.fields.values():
+        if field_data.write_only:
             continue
 
-        if isinstance(field.field, (ForeignKey, ManyToManyField)):
-            if isinstance(field_data, Serializer) and deep > 1:
-                _prefetch_related, _select_related = get_related(field_data, model='', upper_field=field_name,
-                                                                 deep=deep - 1)
-                prefetch_related += _prefetch_related
-                select_related += _select_related
-
-            if hasattr(field, 'rel'):
-                prefetch_related.append(field_name)
-            else:
-                select_related.append(field_name)
+        nested = getattr(field_data, 'child', field_data)
+        if field_data.source == '*':
+            relation = (model, upper_field, many)
+        elif isinstance(field_data, RelatedField) and field_data.use_pk_only_optimization():
+            # primary key fields read the foreign key column, the related object is not loaded
+            *parent_attrs, attr = field_data.source_attrs
+            relation = _walk_relations(model, parent_attrs, upper_field, many, prefetch_related, select_related)
+            field = relation and get_model_relations(relation[0]).get(attr)
+            if field is None or not field.concrete or field.many_to_many:
+                _walk_relations(model, field_data.source_attrs, upper_field, many, prefetch_related, select_related)
+            continue
+        else:
+            relation = _walk_relations(
+                model, field_data.source_attrs, upper_field, many, prefetch_related, select_related
+            )
+
+        if relation and isinstance(nested, Serializer) and deep > 1:
+            related_model, field_name, field_many = relation
+            _prefetch_related, _select_related = get_related(
+                nested, model=related_model, upper_field=field_name, deep=deep - 1, many=field_many
+            )
+            prefetch_related += [lookup for lookup in _prefetch_related if lookup not in prefetch_related]
+            select_related += [lookup for lookup in _select_related if lookup not in select_related]
 
     return prefetch_related, select_related
 
 
-def add_related(queryset, serializer, deep=3) -> QuerySet:
-    prefetch_related, select_related = get_related(serializer, deep=deep)
+def parse_fieldset(value, sep='.'):
+    """
+    Function that parses a sparse fieldset like "id,title,another_thing.title" into a tree of field names
+    :param value: Comma separated fields, nested serializer fields are joined with sep
+    :return: Dict like {'id': {}, 'title': {}, 'another_thing': {'title': {}}}, None if value is empty
+    """
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for name in path.strip().split(sep):
+            if not name:
+                break
+            node = node.setdefault(name, {})
+
+    return tree or None
+
+
+def _freeze_fieldset(tree):
+    if tree is None:
+        return None
+    return tuple(sorted((name, _freeze_fieldset(node)) for name, node in tree.items()))
+
+
+def _get_fieldset(serializer, deep):
+    child = getattr(serializer, 'child', serializer)
+    if not isinstance(child, Serializer):
+        return {}
+    return {name: _get_fieldset(field, deep - 1) if deep > 1 else {} for name, field in child.fields.items()}
+
+
+@lru_cache(maxsize=None)
+def get_serializer_fieldset(serializer_class, deep=3) -> dict:
+    """
+    Function that builds the fieldset tree of every field of the serializer, nested serializers up to deep levels
+    """
+    return _get_fieldset(serializer_class(), deep)
+
+
+def normalize_fieldset(tree, known, omit=False):
+    """
+    Function that drops the names of a fieldset tree which are not in the known tree (see get_serializer_fieldset),
+    nested names of other fields are dropped too. The result selects the same or more data
+    :param tree: Fieldset tree of the request
+    :param known: Fieldset tree of the serializer
+    :param omit: The tree lists fields to remove, an entry without known nested names is dropped
+    :return: Fieldset tree, None if no name is known
+    """
+    normalized = {}
+    for name, node in (tree or {}).items():
+        if name not in known:
+            continue
+
+        if node and known[name]:
+            node = normalize_fieldset(node, known[name], omit)
+            if omit and not node:
+                continue
+        elif node:
+            if omit:
+                continue
+            node = {}
+
+        normalized[name] = node or {}
+
+    return normalized or None
+
+
+def prune_serializer(serializer, fields=None, omit=None):
+    """
+    Function that removes fields from a serializer instance and its nested serializers
+    :param serializer: Serializer instance (or ListSerializer)
+    :param fields: Fieldset tree of fields to keep (see parse_fieldset), all fields are kept if not set
+    :param omit: Fieldset tree of fields to remove
+    :return: Serializer
+    """
+    child = getattr(serializer, 'child', serializer)
+    if not isinstance(child, Serializer):
+        return serializer
+
+    for name in list(child.fields):
+        if fields and name not in fields:
+            child.fields.pop(name)
+        elif omit and name in omit and not omit[name]:
+            child.fields.pop(name)
+        elif (fields and fields[name]) or (omit and omit.get(name)):
+            prune_serializer(child.fields[name], fields and fields[name], omit and omit.get(name))
+
+    return serializer
+
+
+def _related_model(model, path):
+    for name in path.split('__') if path else ():
+        model = get_model_relations(model)[name].related_model
+    return model
+
+
+def _concrete_names(model):
+    return {field.name for field in model._meta.concrete_fields if not field.many_to_many}  # noqa
+
+
+def _get_only_columns(serializer, model, path, deep, columns):
+    """
+    Collect columns read by serializer and its nested serializers, {relation path: set of field names}
+    """
+    opts = model._meta  # noqa
+    names = set()
+
+    for field_data in serializer.fields.values():
+        if field_data.write_only:
+            continue
+
+        if field_data.source == '*':
+            names.update(_concrete_names(model))
+            continue
+
+        name = field_data.source_attrs[0]
+        try:
+            model_field = opts.get_field(name)
+        except FieldDoesNotExist:
+            model_field = get_model_relations(model).get(name)
+
+        if model_field is None:
+            # properties and methods may read any column
+            names.update({opts.pk.name} if name == 'pk' else _concrete_names(model))
+            continue
+
+        if model_field.concrete and not model_field.many_to_many:
+            names.add(model_field.name)
+
+        if not model_field.is_relation:
+            continue
+
+        field_path = '__'.join((path, name)) if path else name
+        nested = getattr(field_data, 'child', field_data)
+        related_model = model_field.related_model
+
+        if isinstance(nested, Serializer) and deep > 1 and len(field_data.source_attrs) == 1:
+            _get_only_columns(nested, related_model, field_path, deep - 1, columns)
+        elif isinstance(getattr(nested, 'child_relation', nested), RelatedField) and \
+                getattr(nested, 'child_relation', nested).use_pk_only_optimization():
+            columns.setdefault(field_path, set()).add(related_model._meta.pk.name)  # noqa
+        else:
+            columns.setdefault(field_path, set()).update(_concrete_names(related_model))
+
+    columns.setdefault(path, set()).update(names)
+    return columns
+
+
+def get_related_only(serializer, model=None, deep=3):
+    """
+    Function that builds a relation plan which loads only the columns read by the serializer
+    :param serializer: Serializer class or instance
+    :param model: Model of the serializer, taken from serializer Meta if not set
+    :param deep: Max depth of nested serializers
+    :return: Tuple (only, select_related, prefetch) where prefetch is a list of
+        (path, model, only, select_related) used to build Prefetch objects
+    """
+    if not isinstance(serializer, Serializer):
+        serializer = serializer()
+
+    if not model:
+        model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+
+    prefetch_related, select_related = get_related(serializer, model=model, deep=deep)
+    columns = _get_only_columns(serializer, model, '', deep, {})
+    prefetch_related = sorted(set(prefetch_related), key=lambda lookup: lookup.count('__'))
+
+    def get_owner(lookup):
+        owners = [prefetch for prefetch in prefetch_related if lookup.startswith(prefetch + '__')]
+        return max(owners, key=len) if owners else ''
+
+    # to-one relations under a prefetch are joined inside the Prefetch queryset
+    for lookup in list(prefetch_related):
+        *parent, name = lookup.split('__')
+        related_field = get_model_relations(_related_model(model, '__'.join(parent)))[name]
+        if not related_field.one_to_many and not related_field.many_to_many:
+            prefetch_related.remove(lookup)
+            select_related.append(lookup)
+
+    levels = {'': ([], set(columns.get('', _concrete_names(model))))}
+    for lookup in prefetch_related:
+        *parent, name = lookup.split('__')
+        related_field = get_model_relations(_related_model(model, '__'.join(parent)))[name]
+        lookup_model = related_field.related_model
+        only = set(columns.get(lookup, _concrete_names(lookup_model)))
+        if related_field.one_to_many:
+            # reverse foreign key, django needs the column to match objects to their parents
+            only.add(related_field.field.name)
+        levels[lookup] = ([], only)
+
+    for lookup in select_related:
+        owner = get_owner(lookup)
+        relative = lookup[len(owner) + 2:] if owner else lookup
+        owner_select, owner_only = levels[owner]
+        owner_select.append(relative)
+        *parent, name = lookup.split('__')
+        if get_model_relations(_related_model(model, '__'.join(parent)))[name].concrete:
+            owner_only.add(relative)
+        lookup_model = _related_model(model, lookup)
+        owner_only.update(f'{relative}__{name}' for name in columns.get(lookup, _concrete_names(lookup_model)))
+
+    select, only = levels['']
+    prefetch = [
+        (lookup, _related_model(model, lookup), tuple(sorted(levels[lookup][1])), tuple(levels[lookup][0]))
+        for lookup in prefetch_related
+    ]
+    return tuple(sorted(only)), tuple(select), tuple(prefetch)
+
+
+RelatedPlanInfo = namedtuple('RelatedPlanInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+RELATED_PLAN_MAXSIZE = 1024
+_related_plans = {}
+_related_plans_stats = {'hits': 0, 'misses': 0}
+
+
+def get_related_plan(serializer, model=None, deep=3, only=False, fields=None, omit=None):
+    """
+    Cached version of get_related (get_related_only if only is set),
+    the plan is computed once per (serializer class, model, deep, fields, omit), fields and omit are normalized
+    by the serializer fields first so unknown names don't create new plans
+    :param serializer: Serializer class or instance
+    :param model: Model of the serializer, taken from serializer Meta if not set
+    :param deep: Max depth of nested serializers
+    :param only: Build the plan with get_related_only
+    :param fields: Fieldset tree of serializer fields to keep (see parse_fieldset)
+    :param omit: Fieldset tree of serializer fields to remove
+    :return: Tuple (prefetch_related, select_related) of tuples, or get_related_only result
+    """
+    serializer_class = serializer if isinstance(serializer, type) else type(serializer)
+    if fields or omit:
+        known = get_serializer_fieldset(serializer_class, deep)
+        fields, omit = normalize_fieldset(fields, known), normalize_fieldset(omit, known, omit=True)
+    key = (serializer_class, model, deep, only, _freeze_fieldset(fields), _freeze_fieldset(omit))
+
+    plan = _related_plans.get(key)
+    if plan is not None:
+        _related_plans_stats['hits'] += 1
+        return plan
+
+    _related_plans_stats['misses'] += 1
+    if fields or omit:
+        serializer = prune_serializer(serializer_class(), fields, omit)
+
+    if only:
+        plan = get_related_only(serializer, model=model, deep=deep)
+    else:
+        prefetch_related, select_related = get_related(serializer, model=model, deep=deep)
+        plan = tuple(prefetch_related), tuple(select_related)
+
+    if len(_related_plans) >= RELATED_PLAN_MAXSIZE:
+        _related_plans.pop(next(iter(_related_plans)), None)
+    _related_plans[key] = plan
+
+    return plan
+
+
+def clear_related_plans(serializer=None):
+    """
+    Function that invalidates cached relation plans, use it when serializer fields are changed at runtime
+    :param serializer: Serializer class or instance to invalidate, all plans and stats are cleared if not set
+    """
+    if serializer is None:
+        _related_plans.clear()
+        _related_plans_stats.update(hits=0, misses=0)
+        return
+
+    serializer_class = serializer if isinstance(serializer, type) else type(serializer)
+    for key in [key for key in list(_related_plans) if key[0] is serializer_class]:
+        _related_plans.pop(key, None)
+
+
+def related_plans_info() -> RelatedPlanInfo:
+    return RelatedPlanInfo(
+        _related_plans_stats['hits'], _related_plans_stats['misses'], RELATED_PLAN_MAXSIZE, len(_related_plans)
+    )
+
+
+def add_related(queryset, serializer, deep=3, cache=True, only=False, fields=None, omit=None) -> QuerySet:
+    """
+    Function that adds select_related and prefetch_related for the relations used by serializer
+    :param queryset: QuerySet we are adding relations to
+    :param serializer: Serializer class or instance
+    :param deep: Max depth of nested serializers
+    :param cache: Use the cached relation plan
+    :param only: Load only the columns read by the serializer, .only() for the queryset and
+        Prefetch(..., queryset=Model.objects.only(...)) for the prefetched relations
+    :param fields: Fieldset tree of serializer fields to keep (see parse_fieldset)
+    :param omit: Fieldset tree of serializer fields to remove
+    :return: QuerySet
+    """
+    if not cache and (fields or omit):
+        serializer = prune_serializer(serializer if isinstance(serializer, Serializer) else serializer(), fields, omit)
+
+    if only:
+        plan = get_related_plan(
+            serializer, deep=deep, only=True, fields=fields, omit=omit
+        ) if cache else get_related_only(serializer, deep=deep)
+        return apply_related_only(queryset, plan)
+
+    if cache:
+        prefetch_related, select_related = get_related_plan(serializer, deep=deep, fields=fields, omit=omit)
+    else:
+        prefetch_related, select_related = get_related(serializer, deep=deep)
     return queryset.select_related(*select_related).prefetch_related(*prefetch_related)
 
 
+def apply_related_only(queryset, plan) -> QuerySet:
+    only, select_related, prefetch = plan
+    prefetch_related = []
+
+    for lookup, lookup_model, lookup_only, lookup_select in prefetch:
+        lookup_queryset = lookup_model._default_manager.only(*lookup_only)  # noqa
+        if lookup_select:
+            lookup_queryset = lookup_queryset.select_related(*lookup_select)
+        prefetch_related.append(Prefetch(lookup, queryset=lookup_queryset))
+
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    queryset = queryset.prefetch_related(*prefetch_related)
+
+    # keep deferred fields chosen by the caller
+    if queryset.query.deferred_loading == (frozenset(), True):
+        queryset = queryset.only(*only)
+
+    return queryset
+
+
+def prime_many_to_many(instance, data):
+    """
+    Function that fills the prefetch cache of many to many relations with the saved values,
+    so they are read without queries
+    :param instance: Saved model instance
+    :param data: Validated data, like {'other_things': [<OtherThing: 1>, <OtherThing: 2>]}
+    :return: Instance
+    """
+    for field in instance._meta.many_to_many:  # noqa
+        values = data.get(field.name)
+        if values is None or not all(isinstance(value, field.related_model) for value in values):
+            continue
+
+        queryset = getattr(instance, field.name).all()
+        queryset._result_cache = list(values)  # noqa
+        queryset._prefetch_done = True  # noqa
+        if not hasattr(instance, '_prefetched_objects_cache'):
+            instance._prefetched_objects_cache = {}
+        instance._prefetched_objects_cache[field.name] = queryset  # noqa
+
+    return instance
+
+
 def get_custom_schema_view(title, default_version='v1', description='', *args, **kwargs):
     from drf_yasg import openapi
     from drf_yasg.views import get_schema_view
@@ -1,14 +1,34 @@
-from django.db.models import QuerySet
+import asyncio
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
+from django.core.cache import caches
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist, ValidationError as DjangoValidationError
+from django.db import connections, router, transaction
+from django.db.models import Count, Max, QuerySet, prefetch_related_objects
+from django.http import Http404, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.utils.translation import gettext as _
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import mixins, status
-from rest_framework.decorators import permission_classes, api_view
+from rest_framework.decorators import action, permission_classes, api_view
+from rest_framework.permissions import (
+    AllowAny as AllowAnyPermission, IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
+)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.serializers import ListSerializer, ModelSerializer
 from rest_framework.viewsets import GenericViewSet
 from django_filters import (
     FilterSet,
 )
-from drf_util.utils import add_related
+from drf_util.exceptions import ValidationException
+from drf_util.utils import add_related, parse_fieldset, prime_many_to_many, prune_serializer
 from rest_framework.permissions import (
     AllowAny,
 )
@@ -23,6 +43,96 @@ def health_check(request):
     return Response({'live': True})
 
 
+# permissions which keep no state, one instance is shared by all requests of a viewset action,
+# other permission classes can opt in with a `stateless = True` class attribute
+STATELESS_PERMISSIONS = (AllowAnyPermission, IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly)
+
+SERIALIZER_ATTRIBUTES = (
+    'serializer_class', 'serializer_create_class', 'serializer_retrieve_class', 'serializer_list_class',
+    'serializer_by_action',
+)
+
+RESPONSE_CACHE_PREFIX = 'drf_util:response'
+
+_filter_classes = {}
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def filter_classes_built():
+    """
+    Count of dynamic filter classes built by BaseListModelMixin
+    """
+    return len(_filter_classes)
+
+
+def _generation_key(model):
+    return f'{RESPONSE_CACHE_PREFIX}:generation:{model._meta.label_lower}'  # noqa
+
+
+def get_model_generations(models, alias='default'):
+    """
+    Generation counters of the models, cached responses are keyed by them
+    """
+    cache = caches[alias]
+    keys = [_generation_key(model) for model in models]
+    generations = cache.get_many(keys)
+
+    for key in keys:
+        if key not in generations:
+            # a time based start never reuses the keys of an evicted counter
+            cache.add(key, time.time_ns(), None)
+            generations[key] = cache.get(key)
+
+    return [generations[key] for key in keys]
+
+
+def bump_model_generation(model, alias='default'):
+    """
+    Invalidate the responses cached for the model
+    """
+    cache = caches[alias]
+    key = _generation_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def get_conditional_validators(*parts, last_modified=None):
+    """
+    Weak ETag built from the parts and Last-Modified timestamp (in seconds) for conditional requests
+    """
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f'W/"{digest}"', int(last_modified.timestamp()) if last_modified else None
+
+
+def set_conditional_headers(response, validators):
+    if validators:
+        etag, last_modified = validators
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def has_conditional_field(view, model):
+    if not getattr(view, 'conditional_requests', False):
+        return False
+
+    try:
+        model._meta.get_field(view.conditional_field)  # noqa
+    except FieldDoesNotExist:
+        return False
+    return True
+
+
 class BaseCreateModelMixin:
 
     def create(self, request, return_instance=False, *args, **kwargs):
@@ -34,11 +144,11 @@ class BaseCreateModelMixin:
         if return_instance:
             return instance
 
-        serializer_display = self.get_serializer(instance)  # noqa
-        return Response(serializer_display.data, status=status.HTTP_201_CREATED)
+        return Response(self.get_display_data(instance, serializer), status=status.HTTP_201_CREATED)  # noqa
 
     def perform_create(self, serializer, **kwargs):  # noqa
         instance = serializer.save(**kwargs)
+        self.invalidate_response_cache()  # noqa
         return instance
 
 
@@ -50,15 +160,16 @@ class BaseUpdateModelMixin:
         serializer = self.get_serializer_create(instance, data=request.data, partial=partial)  # noqa
         serializer.is_valid(raise_exception=True)
         instance = self.perform_update(serializer)
-        serializer_display = self.get_serializer(instance)  # noqa
+        data = self.get_display_data(instance, serializer)  # noqa
 
         if getattr(instance, '_prefetched_objects_cache', None):
             instance._prefetched_objects_cache = {}
 
-        return Response(serializer_display.data)
+        return Response(data)
 
     def perform_update(self, serializer):  # noqa
         instance = serializer.save()
+        self.invalidate_response_cache()  # noqa
         return instance
 
     def partial_update(self, request, *args, **kwargs):
@@ -66,6 +177,203 @@ class BaseUpdateModelMixin:
         return self.update(request, *args, **kwargs)
 
 
+class BaseDestroyModelMixin(mixins.DestroyModelMixin):
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        self.invalidate_response_cache()  # noqa
+
+
+class BaseBulkModelMixin:
+    """
+    List payload variants of create, update and destroy on the "bulk" route, every batch runs in one transaction
+    """
+    bulk_max_batch_size = 1000
+    bulk_batch_size = 500
+    bulk_lookup_field = 'id'
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request, *args, **kwargs):
+        data = self.get_bulk_data(request)
+        serializer = self.get_serializer_create(data=data, many=True)  # noqa
+        if not serializer.is_valid():
+            raise ValidationException(serializer.errors)
+
+        with transaction.atomic():
+            instances = self.perform_bulk_create(serializer)
+            self.invalidate_response_cache()  # noqa
+
+        return Response(self.get_bulk_display_data(instances), status=status.HTTP_201_CREATED)
+
+    @bulk_create.mapping.put
+    def bulk_update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        data = self.get_bulk_data(request)
+
+        with transaction.atomic():
+            instances = self.get_bulk_instances(data, select_for_update=True)
+            serializers = [
+                self.get_serializer_create(instance, data=item, partial=partial)  # noqa
+                for instance, item in zip(instances, data)
+            ]
+            errors = [{} if serializer.is_valid() else serializer.errors for serializer in serializers]
+            if any(errors):
+                raise ValidationException(errors)
+
+            instances = self.perform_bulk_update(serializers)
+            self.invalidate_response_cache()  # noqa
+
+        return Response(self.get_bulk_display_data(instances))
+
+    @bulk_create.mapping.patch
+    def bulk_partial_update(self, request, *args, **kwargs):
+        kwargs['partial'] = True
+        return self.bulk_update(request, *args, **kwargs)
+
+    @bulk_create.mapping.delete
+    def bulk_destroy(self, request, *args, **kwargs):
+        data = self.get_bulk_data(request)
+        data = [item if isinstance(item, dict) else {self.bulk_lookup_field: item} for item in data]
+
+        with transaction.atomic():
+            instances = self.get_bulk_instances(data)
+            self.perform_bulk_destroy(instances)
+            self.invalidate_response_cache()  # noqa
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def get_bulk_data(self, request):
+        data = request.data
+        if not isinstance(data, list):
+            raise ValidationException(_('Expected a list of items'))
+        if len(data) > self.bulk_max_batch_size:
+            raise ValidationException(_('Batch size is limited to %s items') % self.bulk_max_batch_size)
+        return data
+
+    def get_bulk_instances(self, data, select_for_update=False):
+        """
+        Instances of the items fetched by one filter(pk__in=...) query, in the order of the items
+        """
+        pk_field = self.get_queryset().model._meta.pk  # noqa
+        keys, errors = [], []
+        for item in data:
+            try:
+                key = pk_field.to_python(item.get(self.bulk_lookup_field) if isinstance(item, dict) else None)
+            except DjangoValidationError:
+                key = None
+            keys.append(key)
+            errors.append({} if key is not None else {self.bulk_lookup_field: [_('This field is required.')]})
+
+        queryset = self.get_queryset().filter(pk__in=[key for key in keys if key is not None])  # noqa
+        if select_for_update:
+            # FOR UPDATE can't lock the nullable side of the outer joins added by select_related
+            queryset = queryset.select_related(None).select_for_update()
+        instances = {instance.pk: instance for instance in queryset}
+
+        seen = set()
+        for index, key in enumerate(keys):
+            if key is None:
+                continue
+            if key not in instances:
+                errors[index] = {self.bulk_lookup_field: [_('Not found.')]}
+            elif key in seen:
+                errors[index] = {self.bulk_lookup_field: [_('Duplicated item.')]}
+            seen.add(key)
+
+        if any(errors):
+            raise ValidationException(errors)
+
+        return [instances[key] for key in keys]
+
+    def perform_bulk_create(self, serializer):
+        if type(serializer).create is not ListSerializer.create or \
+                type(serializer.child).create is not ModelSerializer.create:
+            # custom create() hooks are called for every item
+            return serializer.save()
+
+        model = serializer.child.Meta.model
+        instances, relations = [], []
+        for item in serializer.validated_data:
+            item = dict(item)
+            relations.append({
+                field.name: item.pop(field.name) for field in model._meta.many_to_many if field.name in item
+            })
+            instances.append(model(**item))
+
+        features = connections[router.db_for_write(model)].features
+        if any(relations) and not features.can_return_rows_from_bulk_insert:
+            # without RETURNING bulk_create leaves pk empty, many to many rows need it
+            for instance in instances:
+                instance.save(force_insert=True)
+        else:
+            instances = model._default_manager.bulk_create(instances, batch_size=self.bulk_batch_size)
+
+        self.set_bulk_many_to_many(model, instances, relations)
+        return instances
+
+    def perform_bulk_update(self, serializers):
+        instances, relations, fields = [], [], set()
+        for serializer in serializers:
+            instance = serializer.instance
+            model = type(instance)
+            item = dict(serializer.validated_data)
+            relations.append({
+                field.name: item.pop(field.name) for field in model._meta.many_to_many if field.name in item
+            })
+            for attr, value in item.items():
+                setattr(instance, attr, value)
+            fields.update(item)
+            instances.append(instance)
+
+        if not instances:
+            return instances
+
+        model = type(instances[0])
+        # bulk_update doesn't call save(), fill auto_now fields like modified_at
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False):
+                for instance in instances:
+                    field.pre_save(instance, False)
+                fields.add(field.name)
+
+        if fields:
+            model._default_manager.bulk_update(instances, fields, batch_size=self.bulk_batch_size)
+        self.set_bulk_many_to_many(model, instances, relations)
+        return instances
+
+    def perform_bulk_destroy(self, instances):
+        model = self.get_queryset().model  # noqa
+        model._default_manager.filter(pk__in=[instance.pk for instance in instances]).delete()
+
+    def set_bulk_many_to_many(self, model, instances, relations):
+        for field in model._meta.many_to_many:
+            items = [(instance, item[field.name]) for instance, item in zip(instances, relations) if field.name in item]
+            if not items:
+                continue
+
+            through = field.remote_field.through
+            if not through._meta.auto_created:  # noqa
+                for instance, values in items:
+                    getattr(instance, field.name).set(values)
+                continue
+
+            source, target = f'{field.m2m_field_name()}_id', f'{field.m2m_reverse_field_name()}_id'
+            through.objects.filter(**{f'{source}__in': [instance.pk for instance, values in items]}).delete()
+            through.objects.bulk_create([
+                through(**{source: instance.pk, target: getattr(value, 'pk', value)})
+                for instance, values in items for value in values
+            ], batch_size=self.bulk_batch_size)
+
+    def get_bulk_display_data(self, instances):
+        keys = [instance.pk for instance in instances]
+        if None not in keys:
+            # reload with the relations of the display serializer
+            fetched = {instance.pk: instance for instance in self.get_queryset().filter(pk__in=keys)}  # noqa
+            instances = [fetched.get(key, instance) for key, instance in zip(keys, instances)]
+
+        return self.get_serializer(instances, many=True).data  # noqa
+
+
 class BaseViewSet(GenericViewSet):
     queryset = None
     query_serializer = None
@@ -80,6 +388,25 @@ class BaseViewSet(GenericViewSet):
     select_related = ()
     autocomplete_related = True
     autocomplete_related_deep = 1
+    autocomplete_related_cache = True
+    autocomplete_related_only = False
+    autocomplete_related_only_actions = ('list', 'retrieve')
+    # response of create / update: data of the create serializer if it is the display one, or the instance
+    # re-loaded with the relation plan of the display serializer
+    display_reuse = False
+    display_reload = False
+    # ?fields=id,title,another_thing.title / ?omit=... prune the serializer and the loaded columns
+    sparse_fields = False
+    sparse_fields_param = 'fields'
+    sparse_omit_param = 'omit'
+    sparse_fields_actions = ('list', 'retrieve')
+    # cache of read actions, invalidated by writes of the queryset model and response_cache_models
+    response_cache = False
+    response_cache_actions = ('list', 'retrieve')
+    response_cache_models = ()
+    response_cache_timeout = 60
+    response_cache_alias = 'default'
+    response_cache_lock_timeout = 10
 
     def get_prefetch_related(self):
         prefetch_related = self.prefetch_related
@@ -101,7 +428,15 @@ class BaseViewSet(GenericViewSet):
 
         queryset = super().get_queryset()
         if self.serializer_class and callable(self.get_serializer_class()) and self.autocomplete_related:
-            queryset = add_related(queryset, self.get_serializer(), deep=self.autocomplete_related_deep)
+            fields, omit = self.get_sparse_fields()
+            only = bool(fields or omit) or (
+                self.autocomplete_related_only and self.action in self.autocomplete_related_only_actions
+            )
+            queryset = add_related(
+                queryset, self.get_related_serializer() if only else self.get_serializer(),
+                deep=self.autocomplete_related_deep, cache=self.autocomplete_related_cache, only=only,
+                fields=fields, omit=omit
+            )
 
         # Fetch specified relations
         if not self.autocomplete_related:
@@ -113,12 +448,160 @@ class BaseViewSet(GenericViewSet):
 
         return queryset
 
+    def get_related_serializer(self):
+        # columns are pruned by the serializer which renders the action
+        if self.action == 'list':
+            return self.get_serializer_list()
+        if self.action == 'retrieve':
+            return self.get_serializer_retrieve()
+        return self.get_serializer()
+
     def get_serializer_by_action(self):
         return self.serializer_by_action.get(self.action)
 
+    def get_display_data(self, instance, serializer=None):
+        """
+        Data of the written instance rendered by the display serializer
+        """
+        if self.display_reuse and serializer is not None and type(serializer) is self.get_serializer_class():
+            prime_many_to_many(instance, serializer.validated_data)
+            return serializer.data
+
+        if self.display_reload and instance.pk is not None:
+            # one query per relation level instead of lazy queries per field
+            instance = self.get_queryset().filter(pk=instance.pk).first() or instance
+
+        return self.get_serializer(instance).data
+
+    def get_sparse_fields(self):
+        """
+        Fieldset trees (fields, omit) requested by the query params, see parse_fieldset
+        """
+        request = getattr(self, 'request', None)
+        if not self.sparse_fields or request is None or self.action not in self.sparse_fields_actions:
+            return None, None
+
+        return (
+            parse_fieldset(request.query_params.get(self.sparse_fields_param)),
+            parse_fieldset(request.query_params.get(self.sparse_omit_param)),
+        )
+
+    def get_response_cache_models(self):
+        models = [self.get_response_cache_model(), *self.response_cache_models]
+        return list(dict.fromkeys(model for model in models if model is not None))
+
+    def get_response_cache_model(self):
+        """
+        Model of the queryset, or of the serializer for views without one
+        """
+        try:
+            return self.get_queryset().model
+        except AssertionError:
+            meta = getattr(self.serializer_class, 'Meta', None)
+            return getattr(meta, 'model', None)
+
+    def get_response_cache_scope(self, request):
+        """
+        Part of the cache key that separates users, override it to share responses between users with same rights
+        """
+        user = getattr(request, 'user', None)
+        return user.pk if user is not None and user.is_authenticated else None
+
+    def get_response_cache_key(self, request):
+        view = type(self)
+        parts = (
+            f'{view.__module__}.{view.__qualname__}', self.action,
+            sorted(self.kwargs.items()),
+            sorted((key, sorted(values)) for key, values in request.query_params.lists()),
+            self.get_response_cache_scope(request),
+            get_model_generations(self.get_response_cache_models(), self.response_cache_alias),
+        )
+        return f'{RESPONSE_CACHE_PREFIX}:{hashlib.md5(repr(parts).encode()).hexdigest()}'
+
+    def get_cached_response(self, request, compute):
+        """
+        Response of compute() cached by get_response_cache_key, only one request at a time computes a missing key
+        """
+        if not self.response_cache or self.action not in self.response_cache_actions:
+            return compute()
+
+        cache = caches[self.response_cache_alias]
+        key = self.get_response_cache_key(request)
+        cached = cache.get(key)
+
+        if cached is None:
+            lock_key = f'{key}:lock'
+            if cache.add(lock_key, True, self.response_cache_lock_timeout):
+                try:
+                    return self.set_cached_response(key, compute())
+                finally:
+                    cache.delete(lock_key)
+
+            # another request is computing the response, wait for it
+            deadline = time.monotonic() + self.response_cache_lock_timeout
+            while cached is None and time.monotonic() < deadline:
+                time.sleep(0.05)
+                cached = cache.get(key)
+
+            if cached is None:
+                return self.set_cached_response(key, compute())
+
+        return self.get_response_from_cache(request, cached)
+
+    def get_response_from_cache(self, request, cached):  # noqa
+        validators = cached['validators']
+        if validators:
+            response = get_conditional_response(request, *validators)
+            if response is not None:
+                return set_conditional_headers(response, validators)
+
+        return set_conditional_headers(Response(cached['data']), validators)
+
+    def set_cached_response(self, key, response):
+        # only complete responses are cached, not 304 or streaming ones
+        if response.status_code == status.HTTP_200_OK and isinstance(response, Response):
+            etag, last_modified = response.get('ETag'), response.get('Last-Modified')
+            caches[self.response_cache_alias].set(key, {
+                'data': response.data,
+                'validators': (etag, parse_http_date_safe(last_modified)) if etag else None,
+            }, self.response_cache_timeout)
+        return response
+
+    def invalidate_response_cache(self):
+        """
+        Bump the generations of the view models after commit, views without response_cache and
+        response_cache_models don't touch the cache
+        """
+        if not self.response_cache and not self.response_cache_models:
+            return
+
+        models, alias = self.get_response_cache_models(), self.response_cache_alias
+        transaction.on_commit(lambda: [bump_model_generation(model, alias) for model in models])
+
     def get_serializer_class(self):
         return self.get_serializer_by_action() or super().get_serializer_class()
 
+    @classmethod
+    def get_action_resolution(cls) -> dict:
+        """
+        Permissions and serializers resolved per action, built once per viewset class on first use
+        """
+        resolution = cls.__dict__.get('_action_resolution')
+        if resolution is None:
+            resolution = {'permissions': {}, 'serializers': {}}
+            setattr(cls, '_action_resolution', resolution)
+        return resolution
+
+    @classmethod
+    def reset_action_resolution(cls):
+        # call it after permission or serializer attributes are changed at runtime
+        if '_action_resolution' in cls.__dict__:
+            delattr(cls, '_action_resolution')
+
+    def _uses_class_resolution(self, *names):
+        # attributes passed to as_view(**initkwargs) are set on the instance and can't be resolved per class
+        return not any(name in self.__dict__ for name in names)
+
     @staticmethod
     def make_permissions(classes: list = None):
         permissions = []
@@ -134,19 +617,64 @@ class BaseViewSet(GenericViewSet):
 
         return permissions
 
+    def get_permission_classes(self):
+        # return permission_classes depending on `action`
+        if self.action in self.permission_classes_by_action:
+            return self.permission_classes_by_action[self.action]
+
+        # action is not set return default permission_classes_by_action, if exists
+        return self.permission_classes_by_action.get('default') or self.permission_classes
+
+    def get_permission_plan(self):
+        """
+        List of (permission class, None) for permissions created per request and (None, instance) for
+        stateless permissions which are reused, see STATELESS_PERMISSIONS
+        """
+        plan = []
+        classes = self.get_permission_classes()
+        for permission in classes if hasattr(classes, '__iter__') else [classes]:
+            if not callable(permission):
+                plan.append((None, permission))
+            elif permission in STATELESS_PERMISSIONS or getattr(permission, 'stateless', False) is True:
+                plan.append((None, permission()))
+            else:
+                plan.append((permission, None))
+
+        return tuple(plan)
+
     def get_permissions(self):
-        permissions = self.make_permissions(classes=self.permission_classes)
+        if not self._uses_class_resolution('permission_classes', 'permission_classes_by_action'):
+            return self.make_permissions(classes=self.get_permission_classes())
 
-        try:
-            # return permission_classes depending on `action`
-            permissions = self.make_permissions(classes=self.permission_classes_by_action[self.action])
-        except KeyError:
-            # action is not set return default permission_classes_by_action, if exists
-            default = self.permission_classes_by_action.get('default')
-            if default:
-                permissions = self.make_permissions(classes=default)
+        resolution = self.get_action_resolution()['permissions']
+        plan = resolution.get(self.action)
+        if plan is None:
+            plan = resolution[self.action] = self.get_permission_plan()
 
-        return permissions
+        return [permission() if permission else instance for permission, instance in plan]
+
+    def get_serializer_classes(self):
+        """
+        Tuple of (create, retrieve, list) serializer classes for the current action
+        """
+        if type(self).get_serializer_by_action is not BaseViewSet.get_serializer_by_action or \
+                not self._uses_class_resolution(*SERIALIZER_ATTRIBUTES):
+            return self._get_serializer_classes()
+
+        resolution = self.get_action_resolution()['serializers']
+        serializers = resolution.get(self.action)
+        if serializers is None:
+            serializers = resolution[self.action] = self._get_serializer_classes()
+
+        return serializers
+
+    def _get_serializer_classes(self):
+        by_action = self.get_serializer_by_action()
+        return (
+            by_action or self.serializer_create_class or self.serializer_class,
+            by_action or self.serializer_retrieve_class or self.serializer_class,
+            by_action or self.serializer_list_class or self.serializer_class,
+        )
 
     def get_serializer_create(self, *args, **kwargs):
         serializer_class = self.get_serializer_create_class()
@@ -156,12 +684,12 @@ class BaseViewSet(GenericViewSet):
     def get_serializer_retrieve(self, *args, **kwargs):
         serializer_class = self.get_serializer_retrieve_class()
         kwargs['context'] = self.get_serializer_context()
-        return serializer_class(*args, **kwargs)
+        return prune_serializer(serializer_class(*args, **kwargs), *self.get_sparse_fields())
 
     def get_serializer_list(self, *args, **kwargs):
         serializer_class = self.get_serializer_list_class()
         kwargs['context'] = self.get_serializer_context()
-        return serializer_class(*args, **kwargs)
+        return prune_serializer(serializer_class(*args, **kwargs), *self.get_sparse_fields())
 
     def get_query_serializer(self):
         if self.action == ['retrieve', 'post', 'patch']:
@@ -169,13 +697,13 @@ class BaseViewSet(GenericViewSet):
         return self.query_serializer
 
     def get_serializer_create_class(self):
-        return self.get_serializer_by_action() or self.serializer_create_class or self.serializer_class
+        return self.get_serializer_classes()[0]
 
     def get_serializer_retrieve_class(self):
-        return self.get_serializer_by_action() or self.serializer_retrieve_class or self.serializer_class
+        return self.get_serializer_classes()[1]
 
     def get_serializer_list_class(self):
-        return self.get_serializer_by_action() or self.serializer_list_class or self.serializer_class
+        return self.get_serializer_classes()[2]
 
     def get_object_id(self):
         return self.kwargs.get(self.lookup_field)
@@ -187,39 +715,149 @@ class BaseListModelMixin:
     filterset_fields = []
     ordering_fields = '__all__'
     ordering = ['-id']
+    # ETag / Last-Modified from Max(conditional_field) and Count of the filtered queryset
+    conditional_requests = False
+    conditional_field = 'modified_at'
+    list_stream = False
+    list_stream_chunk_size = 2000
+    list_stream_format = 'json'
 
     def __init__(self, **kwargs):
         # Automatically create a filter class for available filter set fields
         if not getattr(self, 'filter_class', None) and hasattr(self, 'filterset_fields'):
-            # Dynamic filter classes
-            namespace = self.queryset.model.__name__  # noqa
-            self.filter_class = type(f'{namespace}FilterClass', (FilterSet,), {
+            self.filter_class = self.get_dynamic_filter_class()
+
+        super().__init__(**kwargs)
+
+    def get_dynamic_filter_class(self):
+        # Dynamic filter classes are built once per view class, model and fields
+        model = self.queryset.model  # noqa
+        key = (type(self), model, _freeze(self.filterset_fields))
+
+        filter_class = _filter_classes.get(key)
+        if filter_class is None:
+            namespace = model.__name__
+            filter_class = _filter_classes[key] = type(f'{namespace}FilterClass', (FilterSet,), {
                 'Meta': type(f'{namespace}FilterMetaClass', (object,), {
-                    'model': self.queryset.model,  # noqa
+                    'model': model,
                     'fields': self.filterset_fields
                 })
             })
 
-        super().__init__(**kwargs)
+        return filter_class
 
     def list(self, request, *args, **kwargs):
+        return self.get_cached_response(request, lambda: self.get_list_response(request))  # noqa
+
+    def get_list_response(self, request):
         queryset = self.filter_queryset(self.get_queryset())  # noqa
 
+        validators = self.get_list_validators(queryset)
+        if validators:
+            response = get_conditional_response(request, *validators)
+            if response is not None:
+                return set_conditional_headers(response, validators)
+
         page = self.paginate_queryset(queryset)  # noqa
         if page is not None:
             serializer = self.get_serializer_list(page, many=True)  # noqa
-            return self.get_paginated_response(serializer.data)  # noqa
+            return set_conditional_headers(self.get_paginated_response(serializer.data), validators)  # noqa
+
+        if self.list_stream:
+            return set_conditional_headers(self.get_streaming_response(queryset), validators)
 
         serializer = self.get_serializer_list(queryset, many=True)  # noqa
-        return Response(serializer.data)
+        return set_conditional_headers(Response(serializer.data), validators)
+
+    def get_list_validators(self, queryset):
+        if not has_conditional_field(self, queryset.model):
+            return None
+
+        # only the ETag, Max() is not monotonic (deletes) and Last-Modified has a one second resolution
+        aggregate = queryset.order_by().aggregate(last_modified=Max(self.conditional_field), count=Count('pk'))
+        return get_conditional_validators(
+            type(self).__qualname__, self.request.get_full_path(),  # noqa
+            aggregate['count'], aggregate['last_modified']
+        )
+
+    def iterate_chunks(self, queryset):
+        # prefetches are applied per chunk, iterator() alone doesn't do it on old django versions
+        lookups = queryset._prefetch_related_lookups  # noqa
+        fetch_only_annotation = queryset.query.__dict__.get('fetch_only_annotation')
+        if fetch_only_annotation:
+            queryset = queryset.annotate(**fetch_only_annotation)
+
+        chunk = []
+        for obj in queryset.prefetch_related(None).iterator(chunk_size=self.list_stream_chunk_size):
+            chunk.append(obj)
+            if len(chunk) >= self.list_stream_chunk_size:
+                prefetch_related_objects(chunk, *lookups)
+                yield chunk
+                chunk = []
+
+        if chunk:
+            prefetch_related_objects(chunk, *lookups)
+            yield chunk
+
+    def stream_content(self, queryset):
+        ndjson = self.list_stream_format == 'ndjson'
+
+        if not ndjson:
+            yield b'['
+
+        first = True
+        for chunk in self.iterate_chunks(queryset):
+            yield self.render_stream_chunk(self.get_serializer_list(chunk, many=True).data, first)  # noqa
+            first = False
+
+        if not ndjson:
+            yield b']'
+
+    def render_stream_chunk(self, data, first):
+        renderer = JSONRenderer()
+        if self.list_stream_format == 'ndjson':
+            return b''.join(renderer.render(item) + b'\n' for item in data)
+
+        # render the chunk as a list and strip its brackets
+        content = renderer.render(data)[1:-1]
+        return content if first else b',' + content
+
+    def get_streaming_response(self, queryset):
+        return StreamingHttpResponse(self.stream_content(queryset), content_type=self.get_stream_content_type())
+
+    def get_stream_content_type(self):
+        return 'application/x-ndjson' if self.list_stream_format == 'ndjson' else 'application/json'
 
 
 class BaseRetrieveModelMixin:
+    # ETag / Last-Modified from pk and conditional_field of the instance
+    conditional_requests = False
+    conditional_field = 'modified_at'
 
     def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(request, lambda: self.get_retrieve_response(request))  # noqa
+
+    def get_retrieve_response(self, request):
         instance = self.get_object()  # noqa
+
+        validators = self.get_retrieve_validators(instance)
+        if validators:
+            response = get_conditional_response(request, *validators)
+            if response is not None:
+                return set_conditional_headers(response, validators)
+
         serializer = self.get_serializer_retrieve(instance)  # noqa
-        return Response(serializer.data)
+        return set_conditional_headers(Response(serializer.data), validators)
+
+    def get_retrieve_validators(self, instance):
+        if not has_conditional_field(self, type(instance)):
+            return None
+
+        modified = getattr(instance, self.conditional_field)
+        return get_conditional_validators(
+            type(self).__qualname__, self.request.get_full_path(), instance.pk, modified,  # noqa
+            last_modified=modified
+        )
 
 
 class BaseReadOnlyViewSet(BaseListModelMixin, BaseRetrieveModelMixin, BaseViewSet):
@@ -228,7 +866,7 @@ class BaseReadOnlyViewSet(BaseListModelMixin, BaseRetrieveModelMixin, BaseViewSe
 
 class BaseModelItemViewSet(
     BaseRetrieveModelMixin,
-    mixins.DestroyModelMixin,
+    BaseDestroyModelMixin,
     BaseCreateModelMixin,
     BaseUpdateModelMixin,
     BaseViewSet
@@ -241,3 +879,312 @@ class BaseModelViewSet(
     BaseModelItemViewSet
 ):
     pass
+
+
+class BaseBulkModelViewSet(
+    BaseBulkModelMixin,
+    BaseModelViewSet
+):
+    pass
+
+
+# ======================================================================================================================
+# Async views
+# ======================================================================================================================
+async def call_hook(function, *args, **kwargs):
+    """
+    Await an async hook, sync hooks run in a thread by sync_to_async
+    """
+    if asyncio.iscoroutinefunction(function):
+        return await function(*args, **kwargs)
+    return await sync_to_async(function)(*args, **kwargs)
+
+
+class AsyncBaseViewSet(BaseViewSet):
+    """
+    BaseViewSet with an async dispatch, handlers can be coroutines. Permissions may define async
+    has_permission / has_object_permission, paginators an async apaginate_queryset
+    """
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+
+        @wraps(view)
+        async def async_view(*args, **kwargs):
+            return await view(*args, **kwargs)
+
+        return async_view
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def ainitial(self, request, *args, **kwargs):
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+
+        neg = self.perform_content_negotiation(request)
+        request.accepted_renderer, request.accepted_media_type = neg
+
+        version, scheme = self.determine_version(request, *args, **kwargs)
+        request.version, request.versioning_scheme = version, scheme
+
+        # authentication and throttles read sessions, users and cache with sync apis
+        await sync_to_async(self.perform_authentication)(request)
+        await self.acheck_permissions(request)
+        await sync_to_async(self.check_throttles)(request)
+
+    async def acheck_permissions(self, request):
+        for permission in self.get_permissions():
+            if not await call_hook(permission.has_permission, request, self):
+                self.permission_denied(
+                    request, message=getattr(permission, 'message', None), code=getattr(permission, 'code', None)
+                )
+
+    async def acheck_object_permissions(self, request, obj):
+        for permission in self.get_permissions():
+            if not await call_hook(permission.has_object_permission, request, self, obj):
+                self.permission_denied(
+                    request, message=getattr(permission, 'message', None), code=getattr(permission, 'code', None)
+                )
+
+    async def afilter_queryset(self, queryset):
+        # filter sets validate values with model choice fields, which query the database
+        return await sync_to_async(self.filter_queryset)(queryset)
+
+    async def aget_object(self):
+        queryset = await self.afilter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (ObjectDoesNotExist, TypeError, ValueError, DjangoValidationError):
+            raise Http404
+
+        await self.acheck_object_permissions(self.request, obj)
+        return obj
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        return await call_hook(
+            getattr(self.paginator, 'apaginate_queryset', self.paginator.paginate_queryset),
+            queryset, self.request, view=self
+        )
+
+    async def aserialize(self, serializer):
+        # fields may read relations which were not prefetched, only the sync orm can load them
+        return await sync_to_async(lambda: serializer.data)()
+
+    async def aget_cached_response(self, request, compute):
+        """
+        get_cached_response for a coroutine compute(), waiting for another request doesn't block a thread
+        """
+        if not self.response_cache or self.action not in self.response_cache_actions:
+            return await compute()
+
+        cache = caches[self.response_cache_alias]
+        # the key reads the queryset and the generations with sync apis
+        key = await sync_to_async(self.get_response_cache_key)(request)
+        cached = await cache.aget(key)
+
+        if cached is None:
+            lock_key = f'{key}:lock'
+            if await cache.aadd(lock_key, True, self.response_cache_lock_timeout):
+                try:
+                    return await sync_to_async(self.set_cached_response)(key, await compute())
+                finally:
+                    await cache.adelete(lock_key)
+
+            deadline = time.monotonic() + self.response_cache_lock_timeout
+            while cached is None and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                cached = await cache.aget(key)
+
+            if cached is None:
+                return await sync_to_async(self.set_cached_response)(key, await compute())
+
+        return self.get_response_from_cache(request, cached)
+
+
+class AsyncListModelMixin(BaseListModelMixin):
+
+    async def list(self, request, *args, **kwargs):
+        return await self.aget_cached_response(request, lambda: self.aget_list_response(request))  # noqa
+
+    async def aget_list_response(self, request):
+        queryset = await self.afilter_queryset(self.get_queryset())  # noqa
+
+        validators = await sync_to_async(self.get_list_validators)(queryset)
+        if validators:
+            response = get_conditional_response(request, *validators)
+            if response is not None:
+                return set_conditional_headers(response, validators)
+
+        page = await self.apaginate_queryset(queryset)  # noqa
+        if page is not None:
+            data = await self.aserialize(self.get_serializer_list(page, many=True))  # noqa
+            return set_conditional_headers(self.get_paginated_response(data), validators)  # noqa
+
+        if self.list_stream:
+            return set_conditional_headers(self.get_streaming_response(queryset), validators)
+
+        objects = await self.afetch_objects(queryset)
+        data = await self.aserialize(self.get_serializer_list(objects, many=True))  # noqa
+        return set_conditional_headers(Response(data), validators)
+
+    async def afetch_objects(self, queryset):
+        lookups = queryset._prefetch_related_lookups  # noqa
+        fetch_only_annotation = queryset.query.__dict__.get('fetch_only_annotation')
+        if fetch_only_annotation:
+            queryset = queryset.annotate(**fetch_only_annotation)
+
+        objects = [obj async for obj in queryset.prefetch_related(None).aiterator(self.list_stream_chunk_size)]
+        if objects and lookups:
+            await sync_to_async(prefetch_related_objects)(objects, *lookups)
+        return objects
+
+    async def aiterate_chunks(self, queryset):
+        lookups = queryset._prefetch_related_lookups  # noqa
+        fetch_only_annotation = queryset.query.__dict__.get('fetch_only_annotation')
+        if fetch_only_annotation:
+            queryset = queryset.annotate(**fetch_only_annotation)
+
+        chunk = []
+        async for obj in queryset.prefetch_related(None).aiterator(self.list_stream_chunk_size):
+            chunk.append(obj)
+            if len(chunk) >= self.list_stream_chunk_size:
+                await sync_to_async(prefetch_related_objects)(chunk, *lookups)
+                yield chunk
+                chunk = []
+
+        if chunk:
+            await sync_to_async(prefetch_related_objects)(chunk, *lookups)
+            yield chunk
+
+    async def astream_content(self, queryset):
+        ndjson = self.list_stream_format == 'ndjson'
+
+        if not ndjson:
+            yield b'['
+
+        first = True
+        async for chunk in self.aiterate_chunks(queryset):
+            data = await self.aserialize(self.get_serializer_list(chunk, many=True))  # noqa
+            yield self.render_stream_chunk(data, first)
+            first = False
+
+        if not ndjson:
+            yield b']'
+
+    def get_streaming_response(self, queryset):
+        # an async iterator, served without blocking the event loop
+        return StreamingHttpResponse(self.astream_content(queryset), content_type=self.get_stream_content_type())
+
+
+class AsyncRetrieveModelMixin(BaseRetrieveModelMixin):
+
+    async def retrieve(self, request, *args, **kwargs):
+        return await self.aget_cached_response(request, lambda: self.aget_retrieve_response(request))  # noqa
+
+    async def aget_retrieve_response(self, request):
+        instance = await self.aget_object()  # noqa
+
+        validators = self.get_retrieve_validators(instance)
+        if validators:
+            response = get_conditional_response(request, *validators)
+            if response is not None:
+                return set_conditional_headers(response, validators)
+
+        data = await self.aserialize(self.get_serializer_retrieve(instance))  # noqa
+        return set_conditional_headers(Response(data), validators)
+
+
+class AsyncCreateModelMixin(BaseCreateModelMixin):
+
+    async def create(self, request, return_instance=False, *args, **kwargs):
+        serializer = self.get_serializer_create(data=request.data)  # noqa
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+
+        instance = await self.aperform_create(serializer, **kwargs)
+
+        if return_instance:
+            return instance
+
+        data = await sync_to_async(self.get_display_data)(instance, serializer)  # noqa
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    async def aperform_create(self, serializer, **kwargs):
+        # serializer.save() may write many to many relations and nested objects, it has no async api
+        return await sync_to_async(self.perform_create)(serializer, **kwargs)
+
+
+class AsyncUpdateModelMixin(BaseUpdateModelMixin):
+
+    async def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        instance = await self.aget_object()  # noqa
+        serializer = self.get_serializer_create(instance, data=request.data, partial=partial)  # noqa
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+
+        instance = await self.aperform_update(serializer)
+        data = await sync_to_async(self.get_display_data)(instance, serializer)  # noqa
+
+        if getattr(instance, '_prefetched_objects_cache', None):
+            instance._prefetched_objects_cache = {}
+
+        return Response(data)
+
+    async def aperform_update(self, serializer):
+        return await sync_to_async(self.perform_update)(serializer)
+
+    async def partial_update(self, request, *args, **kwargs):
+        kwargs['partial'] = True
+        return await self.update(request, *args, **kwargs)
+
+
+class AsyncDestroyModelMixin:
+
+    async def destroy(self, request, *args, **kwargs):
+        instance = await self.aget_object()  # noqa
+        await self.aperform_destroy(instance)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    async def aperform_destroy(self, instance):  # noqa
+        await instance.adelete()
+        await sync_to_async(self.invalidate_response_cache)()  # noqa
+
+
+class AsyncReadOnlyViewSet(AsyncListModelMixin, AsyncRetrieveModelMixin, AsyncBaseViewSet):
+    pass
+
+
+class AsyncModelViewSet(
+    AsyncListModelMixin,
+    AsyncRetrieveModelMixin,
+    AsyncDestroyModelMixin,
+    AsyncCreateModelMixin,
+    AsyncUpdateModelMixin,
+    AsyncBaseViewSet
+):
+    pass
@@ -24,3 +24,11 @@ class AnotherThing(BaseModel):
 
     class Meta:
         db_table = 'another_things'
+
+
+class ThingInfo(models.Model):
+    thing = models.OneToOneField('Thing', on_delete=models.CASCADE, related_name='info')
+    description = models.CharField(max_length=63)
+
+    class Meta:
+        db_table = 'thing_infos'
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from drf_util.serializers import build_model_serializer
-from tests.models import Thing, AnotherThing
+from tests.models import Thing, AnotherThing, OtherThing, ThingInfo
 
 
 class ThingSerializer(serializers.ModelSerializer):
@@ -13,3 +13,68 @@ AnotherThingSerializer = build_model_serializer(
     things=ThingSerializer(many=True),
     meta_model=AnotherThing,
 )
+
+
+class AnotherThingShortSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AnotherThing
+        fields = ['id', 'title']
+
+
+class ThingDetailSerializer(serializers.ModelSerializer):
+    another_thing = AnotherThingShortSerializer()
+
+    class Meta:
+        model = Thing
+        fields = ['id', 'another_thing', 'other_things']
+
+
+class ThingInfoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ThingInfo
+        fields = ['description']
+
+
+class OtherThingSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OtherThing
+        fields = ['id', 'title']
+
+
+class ThingRelationsSerializer(serializers.ModelSerializer):
+    info = ThingInfoSerializer()
+    another_thing_title = serializers.CharField(source='another_thing.title')
+    other_things_titles = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Thing
+        fields = ['id', 'info', 'another_thing_title', 'other_things_titles']
+        prefetch_hints = ['other_things__another_thing']
+
+    def get_other_things_titles(self, obj):
+        return [other_thing.another_thing.title for other_thing in obj.other_things.all()]
+
+
+class AnotherThingRelationsSerializer(serializers.ModelSerializer):
+    otherthing_set = OtherThingSerializer(many=True)
+    things = ThingRelationsSerializer(many=True)
+
+    class Meta:
+        model = AnotherThing
+        fields = ['id', 'otherthing_set', 'things']
+
+
+class OtherThingDetailSerializer(serializers.ModelSerializer):
+    another_thing = AnotherThingShortSerializer()
+
+    class Meta:
+        model = OtherThing
+        fields = ['id', 'title', 'another_thing']
+
+
+class ThingOtherThingsSerializer(serializers.ModelSerializer):
+    other_things = OtherThingDetailSerializer(many=True)
+
+    class Meta:
+        model = Thing
+        fields = ['id', 'title', 'other_things']
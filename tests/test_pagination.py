@@ -0,0 +1,121 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection, connections, DatabaseError, DEFAULT_DB_ALIAS
+from django.core.paginator import Paginator
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from drf_util import pagination
+from drf_util.pagination import CustomPagination
+from drf_util.serializers import PaginatorSerializer
+from tests.models import Thing
+
+
+class CountStrategyTestCase(TestCase):
+    fixtures = ['tests/fixtures.json']
+
+    def setUp(self):
+        cache.clear()
+
+    def paginate(self, view=None, **params):
+        paginator = CustomPagination()
+        request = Request(APIRequestFactory().get('/', {'per_page': 2, **params}))
+        results = paginator.paginate_queryset(Thing.objects.order_by('pk'), request, view)
+        return results, paginator.get_paginated_response([item.pk for item in results]).data
+
+    def test_exact(self):
+        self.assertEqual(pagination.get_count(Thing.objects.all()), 5)
+        self.assertEqual(pagination.get_count([1, 2]), 2)
+
+    def test_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(pagination.count_cached(Thing.objects.all()), 5)
+            self.assertEqual(pagination.count_cached(Thing.objects.order_by('-pk')), 5)
+
+        Thing.objects.create(title='new')
+        self.assertEqual(pagination.count_cached(Thing.objects.all()), 5)
+        self.assertEqual(pagination.count_cached(Thing.objects.filter(title='new')), 1)
+
+    def test_capped(self):
+        self.assertEqual(pagination.count_capped(Thing.objects.all(), cap=3), 4)
+        self.assertEqual(pagination.count_capped(Thing.objects.all(), cap=10), 5)
+        self.assertEqual(pagination.display_count(4, 'capped', {'cap': 3}), '3+')
+        self.assertEqual(pagination.display_count(5, 'capped', {'cap': 10}), 5)
+
+    def test_estimated(self):
+        self.assertEqual(pagination.count_estimated(Thing.objects.all()), 5)
+
+        plan = '[{"Plan": {"Plan Rows": 12345}}]'
+        with mock.patch.object(connection, 'vendor', 'postgresql'), \
+                mock.patch.object(QuerySet, 'explain', return_value=plan):
+            self.assertEqual(pagination.count_estimated(Thing.objects.all()), 12345)
+            self.assertEqual(pagination.count_estimated(Thing.objects.all(), threshold=20000), 5)
+
+    def test_view_strategy(self):
+        view = mock.Mock(
+            pagination_count_strategy='capped', pagination_count_options={'cap': 3}, pagination_concurrent_count=None
+        )
+        results, data = self.paginate(view, page=3)
+        self.assertEqual(data['results'], [5])
+        self.assertEqual((data['count'], data['total_pages']), ('3+', None))
+
+        results, data = self.paginate(page=3)
+        self.assertEqual((data['count'], data['total_pages'], data['results']), (5, 3, [5]))
+
+    def test_django_paginator_class(self):
+        view = mock.Mock(
+            pagination_count_strategy='capped', pagination_count_options={'cap': 3}, pagination_concurrent_count=None
+        )
+        with mock.patch.object(CustomPagination, 'django_paginator_class', Paginator):
+            results, data = self.paginate(view, page=3)
+        self.assertEqual((data['count'], data['total_pages'], data['results']), (5, 3, [5]))
+
+    def test_paginator_serializer(self):
+        serializer = PaginatorSerializer(data={'page': 2, 'per_page': 2})
+        serializer.is_valid(raise_exception=True)
+        with mock.patch.object(serializer, 'count_strategy', 'capped'), \
+                mock.patch.object(serializer, 'count_options', {'cap': 2}):
+            objects, count = serializer.paginate_data(Thing.objects.order_by('pk'))
+        self.assertEqual(([item.pk for item in objects], count), ([3, 4], '2+'))
+
+
+class ConcurrentCountTestCase(TransactionTestCase):
+    fixtures = ['tests/fixtures.json']
+
+    def paginate(self, mode, **params):
+        paginator = CustomPagination()
+        request = Request(APIRequestFactory().get('/', {'per_page': 2, **params}))
+        view = mock.Mock(
+            pagination_count_strategy='exact', pagination_count_options={}, pagination_concurrent_count=mode
+        )
+        results = paginator.paginate_queryset(Thing.objects.order_by('pk'), request, view)
+        return paginator.get_paginated_response([item.pk for item in results]).data
+
+    def test_window(self):
+        with self.assertNumQueries(1):
+            data = self.paginate('window', page=2)
+        self.assertEqual(data, {'count': 5, 'total_pages': 3, 'per_page': 2, 'current_page': 2, 'results': [3, 4]})
+        self.assertEqual(self.paginate('window', page=4)['results'], [])
+        self.assertEqual(self.paginate('window', page=4)['count'], 5)
+
+    def test_thread(self):
+        with self.assertNumQueries(1):
+            data = self.paginate('thread', page=3)
+        self.assertEqual(data, {'count': 5, 'total_pages': 3, 'per_page': 2, 'current_page': 3, 'results': [5]})
+        self.assertEqual(self.paginate('thread', page=4)['results'], [])
+
+    def test_thread_connection(self):
+        backend = type(connections[DEFAULT_DB_ALIAS])
+        with mock.patch.object(backend, 'close', autospec=True) as close, \
+                mock.patch.object(backend, 'close_if_unusable_or_obsolete', autospec=True) as check:
+            self.paginate('thread', page=1)
+            self.paginate('thread', page=2)
+            self.assertEqual((check.call_count, close.call_count), (2, 0))
+
+            count = mock.PropertyMock(side_effect=DatabaseError)
+            with mock.patch.object(pagination.CountPaginator, 'count', count), self.assertRaises(DatabaseError):
+                self.paginate('thread', page=1)
+            close.assert_called_once()
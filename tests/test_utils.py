@@ -1,8 +1,16 @@
+import copy
+import os
+import tempfile
+from datetime import datetime
+from unittest import mock
+
 from django.test import TestCase
 
 from drf_util import utils
-from tests.models import AnotherThing, Thing
-from tests.serializers import AnotherThingSerializer
+from tests.models import AnotherThing, OtherThing, Thing, ThingInfo
+from tests.serializers import (
+    AnotherThingSerializer, ThingDetailSerializer, ThingRelationsSerializer, AnotherThingRelationsSerializer
+)
 
 
 class UtilsTests(TestCase):
@@ -16,12 +24,56 @@ class UtilsTests(TestCase):
         self.assertEqual(utils.dict_merge(a, {}), a)
         self.assertEqual(utils.dict_merge({}, b), b)
 
+    def test_dict_diff(self):
+        a = {'a': 2, 'b': {'c': 2, 'd': 1}}
+        b = {'b': {'c': 3, 'd': 1}, 'e': 4}
+        self.assertEqual(utils.dict_diff(a, b), ({'a': 2, 'b': {'c': 2}}, {'a': None, 'b': {'c': 3}}))
+
+        patch = utils.dict_diff_patch(a, b)
+        self.assertEqual(sorted(patch, key=str), sorted([
+            (('a',), 2, utils.MISSING), (('e',), utils.MISSING, 4), (('b', 'c'), 2, 3)
+        ], key=str))
+        self.assertEqual(utils.dict_apply_patch(copy.deepcopy(a), patch), b)
+        self.assertEqual(utils.dict_apply_patch(copy.deepcopy(b), patch, reverse=True), a)
+
+    def test_dict_normalise(self):
+        data = {'a': 1, 'b': {'c': 2, 'd': {'e': 3, 'f': 3}}}
+        self.assertEqual(utils.dict_normalise(data), {'a': 1, 'b__c': 2, 'b__d__e': 3, 'b__d__f': 3})
+        self.assertEqual(utils.dict_unnormalise(utils.dict_normalise(data)), data)
+        self.assertEqual(utils.dict_unnormalise(utils.dict_normalise(data, '.'), '.'), data)
+
+        deep = {}
+        for _ in range(5000):
+            deep = {'a': deep, 'b': 1}
+        self.assertEqual(len(utils.dict_normalise(deep)), 5000)
+
     def test_gt(self):
         data = {"a": {"b": 1, "c": [{"d": 2}, {"d": 3}]}}
         self.assertEqual(utils.gt(data, 'a.b'), 1)
         self.assertEqual(utils.gt(data, 'a.c.0.d'), 2)
         self.assertIsNone(utils.gt(data, 'a.b.c'))
         self.assertEqual(utils.gt(data, 'a.c.*.d'), [2, 3])
+        self.assertEqual(utils.gt(data, 'a.x', 'default'), 'default')
+        self.assertEqual(utils.gt({'a': [{'d': 2}]}, 'a.*.d'), 2)
+        self.assertEqual(utils.gt({'a': []}, 'a.*.d', 'default'), 'default')
+        self.assertIsNone(utils.gt(data, None))
+
+    def test_compile_path(self):
+        data = {"a": {"b": 1, "c": [{"d": 2}, {"d": 3}]}}
+        accessor = utils.compile_path('a/c/*/d', '/')
+        self.assertIs(accessor, utils.compile_path('a/c/*/d', '/'))
+        self.assertEqual(accessor(data), [2, 3])
+        self.assertEqual(accessor({}, 'default'), 'default')
+        self.assertEqual(utils.compile_path('a.c.1.d')(data), 3)
+
+    def test_gt_many(self):
+        objects = [{"a": {"b": 1, "c": [{"d": 2}, {"d": 3}]}}, {"a": {"b": 4}}]
+        self.assertEqual(utils.gt_many(objects, ['a.b', 'a.c.*.d'], default=0), {
+            'a.b': [1, 4],
+            'a.c.*.d': [[2, 3], 0],
+        })
+        self.assertEqual(utils.gt_many(objects, ['a.b', 'a.x'], rows=True), [(1, None), (4, None)])
+        self.assertEqual(utils.gt_many([], ['a.b']), {'a.b': []})
 
     def test_sf(self):
         def func():
@@ -38,12 +90,36 @@ class UtilsTests(TestCase):
         self.assertEqual(utils.join_url('http://test.com/', 'page.html'), 'http://test.com/page.html')
         self.assertEqual(utils.join_url('http://test.com', '/page.html'), 'http://test.com/page.html')
 
+    def test_st(self):
+        self.assertEqual(utils.st('a.b', 1), {'a': {'b': 1}})
+        self.assertEqual(utils.st('', 1), 1)
+
+    def test_st_many(self):
+        self.assertEqual(utils.st_many({'a.b': 1, 'a.c': 2, 'd': 3}), {'a': {'b': 1, 'c': 2}, 'd': 3})
+        self.assertEqual(utils.st_many({'a.1.b': 1, 'a.0': 2}), {'a': [2, {'b': 1}]})
+        self.assertEqual(utils.st_many({'a.1': 1}, indexes=False), {'a': {'1': 1}})
+        self.assertEqual(utils.st_many({'a': 1, 'a__b': 2}, sep='__'), {'a': {'b': 2}})
+        self.assertEqual(utils.st_many({'a.0': 1, 'a.x': 2}), {'a': {'0': 1, 'x': 2}})
+        self.assertEqual(
+            utils.st_many({'a.x.b': 2, 'a.0': 1, 'c.1': 3}), {'a': {'x': {'b': 2}, '0': 1}, 'c': [None, 3]}
+        )
+
     def test_get_object_labels(self):
         data = {"a": {"b": 'title'}, "c": 'test'}
 
         self.assertEqual(sorted(utils.get_object_labels(data)), sorted(['title', 'test']))
         self.assertEqual(utils.get_object_labels(data, ['c']), ['test'])
 
+        deep = 'bottom'
+        for _ in range(5000):
+            deep = {'a': [deep, 'top']}
+        self.assertEqual(sorted(utils.get_object_labels(deep)), ['bottom', 'top'])
+
+        labels = utils.iter_object_labels({'a': ['x', 'y', {'b': 'x'}], 'b': 'z'})
+        self.assertNotIsInstance(labels, list)
+        self.assertEqual(sorted(labels), ['x', 'y', 'z'])
+        self.assertEqual(list(utils.iter_object_labels({'a': ['x', {'b': 'x'}]}, ['b'], unique=False)), ['x'])
+
     def test_min_next(self):
         items = [4, 6, 1]
         self.assertEqual(utils.min_next(items, 2), 4)
@@ -56,6 +132,17 @@ class UtilsTests(TestCase):
         self.assertEqual(utils.date('2019-03-18T09:28:29.540898+00:00').minute, 28)
         self.assertEqual(utils.date('2019-03-18T09:28:29.540898+00:00').second, 29)
         self.assertEqual(utils.date('2019-03-18T09:28:29.540898+00:00').microsecond, 540898)
+        self.assertEqual(utils.date('2019-03-18T09:28:29Z'), utils.date('18 March 2019 09:28:29'))
+        self.assertIsNone(utils.date(None))
+
+    def test_to_dt(self):
+        items = ['2019-03-18', None, '18 March 2019']
+        result = utils.to_dt(items, copy=True)
+        self.assertEqual(result, [datetime(2019, 3, 18), None, datetime(2019, 3, 18)])
+        self.assertEqual(items[0], '2019-03-18')
+        self.assertEqual(utils.to_dt(item for item in items), result)
+        self.assertIs(utils.to_dt(items), items)
+        self.assertEqual(items, result)
 
     def test_get_applications(self):
         apps = ['tests.apps.app1']
@@ -65,6 +152,45 @@ class UtilsTests(TestCase):
             utils.get_applications('tests/apps', inside_file='models.py', only_directory=False),
             ['tests.apps.app1.models']
         )
+        self.assertEqual(utils.get_applications('tests/apps', inside_file='views.py'), [])
+        self.assertEqual(utils.get_applications('tests/missing'), [])
+
+    def test_get_applications_paths(self):
+        utils.clear_applications_cache()
+        self.assertEqual(utils.get_applications('tests/apps/'), ['tests.apps.app1'])
+        self.assertEqual(
+            utils.get_applications('tests/apps', inside_file='fixtures/*.json'), ['tests.apps.app1.fixtures']
+        )
+        self.assertEqual(
+            utils.get_applications('tests/apps', inside_file='fixtures/*.json', only_directory=False),
+            ['tests.apps.app1.fixtures.app1.json']
+        )
+        self.assertEqual(utils.get_applications('tests/apps', inside_file='fixtures/*.yaml'), [])
+
+    def test_applications_manifest(self):
+        utils.clear_applications_cache()
+        self.assertEqual(utils.get_applications('tests/apps'), ['tests.apps.app1'])
+
+        with tempfile.TemporaryDirectory() as folder:
+            manifest = os.path.join(folder, 'applications.json')
+            utils.write_applications_manifest(manifest, [('tests/apps', 'models.py')])
+            utils.clear_applications_cache()
+            utils.load_applications_manifest(manifest)
+
+        with mock.patch('os.scandir') as scandir:
+            self.assertEqual(utils.get_applications('tests/apps'), ['tests.apps.app1'])
+            self.assertEqual(
+                utils.get_applications('tests/apps', inside_file='models.py', only_directory=False),
+                ['tests.apps.app1.models']
+            )
+            scandir.assert_not_called()
+        utils.clear_applications_cache()
+
+    def test_missing_applications_manifest(self):
+        utils.clear_applications_cache()
+        with mock.patch.dict(os.environ, {utils.APPLICATIONS_MANIFEST_ENV: 'tests/missing.json'}):
+            self.assertEqual(utils.get_applications('tests/apps'), ['tests.apps.app1'])
+        utils.clear_applications_cache()
 
     def test_add_related(self):
         queryset = AnotherThing.objects.all()
@@ -72,7 +198,153 @@ class UtilsTests(TestCase):
         queryset = utils.add_related(queryset, serializer)
         self.assertIsNotNone(queryset._prefetch_related_lookups)
 
+    def test_get_related(self):
+        self.assertEqual(utils.get_related(ThingDetailSerializer), (['other_things'], ['another_thing']))
+        self.assertEqual(utils.get_related(ThingRelationsSerializer), (
+            ['other_things', 'other_things__another_thing'], ['info', 'another_thing']
+        ))
+        self.assertEqual(utils.get_related(AnotherThingRelationsSerializer), ([
+            'otherthing_set', 'things', 'things__other_things', 'things__other_things__another_thing',
+            'things__info', 'things__another_thing'
+        ], []))
+        self.assertEqual(utils.get_related(AnotherThingRelationsSerializer, deep=1), (['otherthing_set', 'things'], []))
+
+        another_thing = AnotherThing.objects.create(title='Another')
+        other_thing = OtherThing.objects.create(title='Other', another_thing=another_thing)
+        for thing in Thing.objects.all():
+            thing.another_thing = another_thing
+            thing.save()
+            thing.other_things.add(other_thing)
+            ThingInfo.objects.create(thing=thing, description='Info')
+
+        queryset = utils.add_related(AnotherThing.objects.all(), AnotherThingRelationsSerializer, only=True)
+        with self.assertNumQueries(4):
+            data = AnotherThingRelationsSerializer(queryset, many=True).data
+        self.assertEqual(data, AnotherThingRelationsSerializer(AnotherThing.objects.all(), many=True).data)
+
+        queryset = utils.add_related(AnotherThing.objects.all(), AnotherThingRelationsSerializer)
+        with self.assertNumQueries(6):
+            self.assertEqual(AnotherThingRelationsSerializer(queryset, many=True).data, data)
+
+    def test_add_related_only(self):
+        only, select_related, prefetch = utils.get_related_only(ThingDetailSerializer)
+        self.assertEqual(only, ('another_thing', 'another_thing__id', 'another_thing__title', 'id'))
+        self.assertEqual(select_related, ('another_thing',))
+        self.assertEqual([lookup[:3] for lookup in prefetch], [('other_things', OtherThing, ('id',))])
+
+        queryset = utils.add_related(Thing.objects.all(), ThingDetailSerializer, only=True)
+        self.assertEqual(queryset.first().get_deferred_fields(), {'title', 'date_deleted'})
+        self.assertEqual(
+            ThingDetailSerializer(queryset, many=True).data,
+            ThingDetailSerializer(Thing.objects.all(), many=True).data
+        )
+
+    def test_related_plans(self):
+        utils.clear_related_plans()
+        plan = utils.get_related_plan(AnotherThingSerializer)
+        self.assertEqual(plan, tuple(map(tuple, utils.get_related(AnotherThingSerializer))))
+        self.assertIs(utils.get_related_plan(AnotherThingSerializer()), plan)
+        self.assertEqual(utils.related_plans_info()[:2], (1, 1))
+
+        utils.clear_related_plans(AnotherThingSerializer)
+        self.assertEqual(utils.related_plans_info().currsize, 0)
+        utils.add_related(AnotherThing.objects.all(), AnotherThingSerializer, cache=False)
+        self.assertEqual(utils.related_plans_info().currsize, 0)
+
+    def test_sparse_fieldset(self):
+        self.assertIsNone(utils.parse_fieldset(''))
+        self.assertEqual(
+            utils.parse_fieldset('id, another_thing.title,another_thing.id,'),
+            {'id': {}, 'another_thing': {'title': {}, 'id': {}}}
+        )
+
+        serializer = utils.prune_serializer(ThingDetailSerializer(many=True), utils.parse_fieldset('another_thing.id'))
+        self.assertEqual(list(serializer.child.fields), ['another_thing'])
+        self.assertEqual(list(serializer.child.fields['another_thing'].fields), ['id'])
+
+        serializer = utils.prune_serializer(ThingDetailSerializer(), omit=utils.parse_fieldset('id,another_thing.id'))
+        self.assertEqual(list(serializer.fields), ['another_thing', 'other_things'])
+        self.assertEqual(list(serializer.fields['another_thing'].fields), ['title'])
+
+        self.assertEqual(
+            utils.get_related_plan(ThingDetailSerializer, fields={'id': {}}), ((), ())
+        )
+        self.assertEqual(utils.get_related_plan(ThingDetailSerializer), (('other_things',), ('another_thing',)))
+
+        known = utils.get_serializer_fieldset(ThingDetailSerializer)
+        self.assertEqual(known, {'id': {}, 'another_thing': {'id': {}, 'title': {}}, 'other_things': {}})
+        fields = utils.parse_fieldset('id,unknown,another_thing.unknown,other_things.title')
+        self.assertEqual(utils.normalize_fieldset(fields, known), {'id': {}, 'another_thing': {}, 'other_things': {}})
+        omit = utils.parse_fieldset('unknown,another_thing.unknown,other_things.title,id')
+        self.assertEqual(utils.normalize_fieldset(omit, known, omit=True), {'id': {}})
+        self.assertIsNone(utils.normalize_fieldset({'unknown': {}}, known))
+
+        utils.clear_related_plans()
+        for value in ('id', 'id,unknown', 'id,other', 'unknown,id'):
+            utils.get_related_plan(ThingDetailSerializer, fields=utils.parse_fieldset(value))
+        self.assertEqual(utils.related_plans_info().currsize, 1)
+
+    def test_fetch_objects(self):
+        objects, batches = [], []
+        utils.fetch_objects(Thing.objects.order_by('-id'), objects.append, select=2, function_batch=batches.append)
+        self.assertEqual([obj.id for obj in objects], [5, 4, 3, 2, 1])
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+
+        self.assertEqual(utils.get_keyset_field(Thing.objects.all()), ('pk', 'id', False))
+        self.assertIsNone(utils.get_keyset_field(Thing.objects.order_by('title')))
+
+        objects = []
+        utils.fetch_objects(Thing.objects.order_by('title', 'id'), objects.append, select=2)
+        self.assertEqual(len(objects), 5)
+
+    def test_offset_objects_pipeline(self):
+        class Storage(dict):
+            def put(self, key, value):
+                self[key] = value
+
+        def get_function(offset):
+            offset = offset or 0
+            return [{'ocid': item} for item in range(offset, min(offset + 3, 10))], offset + 3
+
+        saved, batches, storage = [], [], Storage()
+        utils.offset_objects_pipeline('offset', get_function, saved.append, storage, workers=2)
+        self.assertEqual(sorted(saved), list(range(10)))
+        self.assertEqual(storage['offset'], 12)
+
+        storage['offset'] = 6
+        utils.offset_objects_pipeline('offset', get_function, storage=storage, save_batch_function=batches.append)
+        self.assertEqual(sorted(batches), [[6, 7, 8], [9]])
+
+        def save_function(item):
+            if item == 4:
+                raise ValueError(item)
+
+        storage = Storage()
+        with self.assertRaises(ValueError):
+            utils.offset_objects_pipeline('offset', get_function, save_function, storage, max_pages=1)
+        self.assertEqual(storage['offset'], 3)
+
+        def failing_get_function(offset):
+            if offset == 6:
+                raise ConnectionError(offset)
+            return get_function(offset)
+
+        saved, storage = [], Storage()
+        with self.assertRaises(ConnectionError):
+            utils.offset_objects_pipeline('offset', failing_get_function, saved.append, storage, workers=2)
+        self.assertEqual((sorted(saved), storage['offset']), (list(range(6)), 6))
+
     def test_iterate_query(self):
         queryset = Thing.objects.all()
         for _ in utils.iterate_query(queryset, 'id', 0):
             ...
+
+        self.assertEqual([obj.id for obj in utils.iterate_query(queryset, 'id', 2, limit=2)], [3, 4, 5])
+        self.assertEqual(
+            [obj.id for obj in utils.iterate_query(queryset, ('title', '-id'), limit=2)], [5, 4, 3, 2, 1]
+        )
+        self.assertEqual(
+            list(utils.iterate_query(queryset, ('title', 'id'), ('Thing title', 3), limit=2, values_list=['title'])),
+            [('Thing title',), ('Thing title',)]
+        )
+        self.assertEqual([obj.id for obj in utils.iterate_query(queryset, cursor=True, only=['title'])], [1, 2, 3, 4, 5])
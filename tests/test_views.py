@@ -1,7 +1,36 @@
+import asyncio
+import base64
+import json
+import time
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models.functions import Upper
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.http import http_date
+from rest_framework.permissions import AllowAny, BasePermission, IsAuthenticated
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.serializers import ModelSerializer
+from rest_framework.test import APIClient, APIRequestFactory
 
+from drf_util import views
+from drf_util.exceptions import ValidationException
+from drf_util.pagination import CustomCursorPagination
 from drf_util.tests import BaseTestCase, CRUDTestCase
-from tests.models import Thing
+from tests.models import Thing, AnotherThing, OtherThing
+from tests.serializers import (
+    ThingSerializer, ThingDetailSerializer, AnotherThingShortSerializer, ThingOtherThingsSerializer
+)
+from tests.view import (
+    ThingViewSet, ThingRelatedViewSet, ThingStreamViewSet, ThingCursorViewSet, AnotherThingCachedViewSet,
+    ThingReloadViewSet, ThingReuseViewSet, ThingAsyncViewSet, AnotherThingViewSet
+)
 
 
 class ViewsTestCase(BaseTestCase, TestCase):
@@ -10,6 +39,613 @@ class ViewsTestCase(BaseTestCase, TestCase):
         self.assertEqual(len(response['schemes']), 2)
 
 
+class FilterClassTestCase(TestCase):
+    def test_dynamic_filter_class(self):
+        filter_class = ThingViewSet().filter_class
+        self.assertIsNot(ThingRelatedViewSet().filter_class, filter_class)
+        built = views.filter_classes_built()
+
+        self.assertIs(ThingViewSet().filter_class, filter_class)
+        self.assertEqual(filter_class._meta.fields, ['title', 'another_thing'])  # noqa
+        ThingRelatedViewSet()
+        self.assertEqual(views.filter_classes_built(), built)
+
+
+class MessagePermission(BasePermission):
+    def has_permission(self, request, view):
+        self.message = f'Custom message for {request}'
+        return True
+
+
+class StatelessPermission(BasePermission):
+    stateless = True
+
+
+class ThingPermissionsViewSet(ThingViewSet):
+    permission_classes = [AllowAny]
+    permission_classes_by_action = {'list': [IsAuthenticated, MessagePermission, StatelessPermission]}
+    serializer_by_action = {'update': ThingDetailSerializer}
+    serializer_list_class = ThingDetailSerializer
+
+
+class ActionResolutionTestCase(TestCase):
+    def get_view(self, action, **kwargs):
+        view = ThingPermissionsViewSet(**kwargs)
+        view.action = action
+        return view
+
+    def test_permissions(self):
+        first, second = self.get_view('list').get_permissions(), self.get_view('list').get_permissions()
+        self.assertIsInstance(first[0], IsAuthenticated)
+        self.assertIs(first[0], second[0])
+        self.assertIsInstance(first[1], MessagePermission)
+        self.assertIsNot(first[1], second[1])
+        self.assertIsInstance(first[2], StatelessPermission)
+        self.assertIs(first[2], second[2])
+        self.assertIsInstance(self.get_view('retrieve').get_permissions()[0], AllowAny)
+
+        permissions = self.get_view('list', permission_classes_by_action={}).get_permissions()
+        self.assertEqual([type(permission) for permission in permissions], [AllowAny])
+
+    def test_serializers(self):
+        view = self.get_view('list')
+        self.assertEqual(view.get_serializer_classes(), (ThingSerializer, ThingSerializer, ThingDetailSerializer))
+        self.assertIn('list', ThingPermissionsViewSet.get_action_resolution()['serializers'])
+        self.assertIs(self.get_view('update').get_serializer_create_class(), ThingDetailSerializer)
+        self.assertIs(self.get_view('create', serializer_class=ThingDetailSerializer).get_serializer_create_class(),
+                      ThingDetailSerializer)
+
+        ThingPermissionsViewSet.reset_action_resolution()
+        self.assertEqual(ThingPermissionsViewSet.get_action_resolution(), {'permissions': {}, 'serializers': {}})
+
+
+class StreamingListTestCase(TestCase):
+    fixtures = ['tests/fixtures.json']
+    client_class = APIClient
+
+    def test_stream_json(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('things-stream-list'))
+            content = b''.join(response.streaming_content)
+
+        self.assertEqual(response['Content-Type'], 'application/json')
+        expected = ThingDetailSerializer(Thing.objects.all(), many=True).data
+        self.assertEqual(json.loads(content), json.loads(json.dumps(expected)))
+
+    def test_stream_ndjson(self):
+        with mock.patch.object(ThingStreamViewSet, 'list_stream_format', 'ndjson'):
+            response = self.client.get(reverse('things-stream-list'))
+            lines = b''.join(response.streaming_content).splitlines()
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([json.loads(line)['id'] for line in lines], [1, 2, 3, 4, 5])
+
+    def test_stream_empty(self):
+        Thing.objects.all().delete()
+        response = self.client.get(reverse('things-stream-list'))
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
+
+
+class CursorPaginationTestCase(TestCase):
+    fixtures = ['tests/fixtures.json']
+    client_class = APIClient
+
+    def get_page(self, **params):
+        response = self.client.get(reverse('things-cursor-list'), {'per_page': 2, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_walk_pages(self):
+        first = self.get_page()
+        self.assertEqual([item['id'] for item in first['results']], [5, 4])
+        self.assertIsNone(first['count'])
+        self.assertIsNone(first['prev_cursor'])
+
+        second = self.get_page(cursor=first['next_cursor'])
+        self.assertEqual([item['id'] for item in second['results']], [3, 2])
+
+        last = self.get_page(cursor=second['next_cursor'])
+        self.assertEqual([item['id'] for item in last['results']], [1])
+        self.assertIsNone(last['next_cursor'])
+
+        previous = self.get_page(cursor=last['prev_cursor'])
+        self.assertEqual(previous['results'], second['results'])
+        self.assertEqual(previous['next_cursor'], second['next_cursor'])
+
+        previous = self.get_page(cursor=previous['prev_cursor'])
+        self.assertEqual(previous['results'], first['results'])
+        self.assertIsNone(previous['prev_cursor'])
+
+    def test_count(self):
+        with mock.patch.object(ThingCursorViewSet.pagination_class, 'cursor_count', True):
+            page = self.get_page()
+        self.assertEqual((page['count'], page['total_pages'], page['per_page']), (5, 3, 2))
+
+    def test_cursor_ordering(self):
+        paginator = CustomCursorPagination()
+        self.assertEqual(paginator.get_cursor_ordering(Thing.objects.order_by('title')), ['title', 'pk'])
+        self.assertEqual(paginator.get_cursor_ordering(Thing.objects.order_by('-title', 'id')), ['-title', '-pk'])
+        self.assertEqual(paginator.get_cursor_ordering(Thing.objects.all(), ThingCursorViewSet), ['-title', '-pk'])
+
+    def test_cursor_nullable_ordering(self):
+        paginator = CustomCursorPagination()
+        queryset = Thing.objects.annotate(annotated=Upper('title'))
+        for ordering in ('another_thing__title', 'another_thing', 'info__description', 'annotated'):
+            with self.assertRaises(ValidationException):
+                paginator.get_cursor_ordering(queryset.order_by('title', ordering))
+
+        with mock.patch.object(ThingCursorViewSet, 'ordering', ['-another_thing__title']):
+            response = self.client.get(reverse('things-cursor-list'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {'ordering': ['Ordering by "another_thing__title" is not supported, it may be null']}
+        )
+
+    def get_cursor(self, values, reverse=False):
+        data = json.dumps({'v': values, 'r': reverse})
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def test_invalid_cursor(self):
+        url = reverse('things-cursor-list')
+        for cursor in ('invalid', self.get_cursor(['x', 'abc']), self.get_cursor([None, 1]),
+                       self.get_cursor(['x', None]), self.get_cursor(['x']), self.get_cursor([['x'], {}])):
+            response = self.client.get(url, {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+
+        response = self.client.get(url, {'cursor': self.get_cursor(['x', '3'])})
+        self.assertEqual(response.status_code, 200)
+
+
+class ConditionalRequestTestCase(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        self.instance = AnotherThing.objects.create(title='first')
+        AnotherThing.objects.create(title='second')
+
+    def test_retrieve(self):
+        url = reverse('another-things-detail', args=[self.instance.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertIn('Last-Modified', response)
+
+        with mock.patch.object(AnotherThingShortSerializer, 'to_representation') as to_representation:
+            with self.assertNumQueries(1):
+                not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            to_representation.assert_not_called()
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+        not_modified = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        self.instance.title = 'changed'
+        self.instance.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_list(self):
+        url = reverse('another-things-list')
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        filtered = self.client.get(url, {'title': 'first'})
+        self.assertNotEqual(filtered['ETag'], etag)
+
+        self.instance.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_if_modified_since(self):
+        url = reverse('another-things-list')
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+
+        AnotherThing.objects.order_by('-modified_at').first().delete()
+        since = http_date(time.time() + 60)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['title'] for item in response.json()], ['first'])
+
+    def test_disabled(self):
+        response = self.client.get(reverse('things-list'))
+        self.assertNotIn('ETag', response)
+
+
+class ResponseCacheTestCase(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        cache.clear()
+        self.instance = AnotherThing.objects.create(title='first')
+
+    def get_titles(self, url):
+        return [item['title'] for item in self.client.get(url).json()]
+
+    def test_cache(self):
+        url = reverse('another-things-cached-list')
+        self.assertEqual(self.get_titles(url), ['first'])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_titles(url), ['first'])
+
+        # writes outside the views are not seen until the generation changes
+        AnotherThing.objects.create(title='second')
+        self.assertEqual(self.get_titles(url), ['first'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'title': 'third'})
+        self.assertEqual(self.get_titles(url), ['first', 'second', 'third'])
+
+        detail = reverse('another-things-cached-detail', args=[self.instance.pk])
+        self.assertEqual(self.client.get(detail).json()['title'], 'first')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(detail, {'title': 'changed'})
+        self.assertEqual(self.client.get(detail).json()['title'], 'changed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(detail)
+        self.assertEqual(self.client.get(detail).status_code, 404)
+
+    def test_other_view_writes(self):
+        url = reverse('another-things-cached-list')
+        self.assertEqual(self.get_titles(url), ['first'])
+
+        # views without response cache don't bump the generations by default
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.client.post(reverse('another-things-list'), {'title': 'second'})
+        self.assertEqual((callbacks, self.get_titles(url)), ([], ['first']))
+
+        with mock.patch.object(AnotherThingViewSet, 'response_cache_models', (AnotherThing,)):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('another-things-list'), {'title': 'third'})
+            self.assertEqual(self.get_titles(url), ['first', 'second', 'third'])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.delete(reverse('another-things-detail', args=[self.instance.pk]))
+            self.assertEqual(self.get_titles(url), ['second', 'third'])
+
+    def test_view_without_queryset(self):
+        class ThingCreateViewSet(views.BaseCreateModelMixin, views.BaseViewSet):
+            serializer_class = ThingSerializer
+
+        view = ThingCreateViewSet.as_view({'post': 'create'})
+        request = APIRequestFactory().post('/', {'title': 'new'}, format='json')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(view(request).status_code, 201)
+        self.assertEqual(callbacks, [])
+
+        ThingCreateViewSet.response_cache_models = (AnotherThing,)
+        self.assertEqual(ThingCreateViewSet().get_response_cache_models(), [Thing, AnotherThing])
+
+    def test_scope(self):
+        url = reverse('another-things-cached-list')
+        self.assertEqual(self.get_titles(url), ['first'])
+        AnotherThing.objects.create(title='second')
+
+        self.client.force_authenticate(User.objects.create(username='user'))
+        self.assertEqual(self.get_titles(url), ['first', 'second'])
+        self.assertEqual(self.get_titles(f'{url}?page=1'), ['first', 'second'])
+
+    def get_view(self):
+        view = AnotherThingCachedViewSet(action='list', kwargs={}, format_kwarg=None)
+        view.request = Request(APIRequestFactory().get('/'))
+        return view
+
+    def test_stampede(self):
+        view = self.get_view()
+        key = view.get_response_cache_key(view.request)
+        compute = mock.Mock(return_value=Response(['computed']))
+        cache.add(f'{key}:lock', True)
+
+        def other_request(seconds):
+            cache.set(key, {'data': ['cached'], 'validators': None})
+
+        with mock.patch.object(views.time, 'sleep', side_effect=other_request):
+            self.assertEqual(view.get_cached_response(view.request, compute).data, ['cached'])
+        compute.assert_not_called()
+
+        cache.clear()
+        cache.add(f'{key}:lock', True)
+        with mock.patch.object(AnotherThingCachedViewSet, 'response_cache_lock_timeout', 0.1):
+            self.assertEqual(view.get_cached_response(view.request, compute).data, ['computed'])
+        compute.assert_called_once()
+
+
+class BulkTestCase(TestCase):
+    fixtures = ['tests/fixtures.json']
+    client_class = APIClient
+
+    def setUp(self):
+        self.url = reverse('things-bulk-bulk-create')
+        self.other_things = [OtherThing.objects.create(title=f'other {index}').pk for index in range(2)]
+
+    def test_create(self):
+        data = [{'title': f'new {index}', 'other_things': self.other_things} for index in range(3)]
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([item['title'] for item in response.json()], ['new 0', 'new 1', 'new 2'])
+        self.assertEqual(Thing.objects.filter(title__startswith='new', other_things=self.other_things[1]).count(), 3)
+
+    def test_create_without_returning(self):
+        data = [{'title': f'new {index}', 'other_things': self.other_things} for index in range(2)]
+        features = type(connection.features)
+        with mock.patch.object(features, 'can_return_rows_from_bulk_insert', mock.PropertyMock(return_value=False)):
+            response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(all(item['id'] for item in response.json()))
+        self.assertEqual(Thing.objects.filter(title__startswith='new', other_things=self.other_things[0]).count(), 2)
+
+    def test_create_hook(self):
+        def create(serializer, validated_data):
+            return ModelSerializer.create(serializer, {**validated_data, 'title': validated_data['title'].upper()})
+
+        with mock.patch.object(ThingSerializer, 'create', autospec=True, side_effect=create) as hook:
+            response = self.client.post(self.url, [{'title': 'first'}, {'title': 'second'}], format='json')
+        self.assertEqual(hook.call_count, 2)
+        self.assertEqual([item['title'] for item in response.json()], ['FIRST', 'SECOND'])
+
+    def test_create_errors(self):
+        response = self.client.post(self.url, [{'title': 'new'}, {}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()[0], {})
+        self.assertIn('title', response.json()[1])
+        self.assertFalse(Thing.objects.filter(title='new').exists())
+
+        response = self.client.post(self.url, [{'title': 'new'}] * 11, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.url, {'title': 'new'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_update(self):
+        data = [{'id': 1, 'title': 'first', 'other_things': self.other_things[:1]}, {'id': '2', 'title': 'second'}]
+        response = self.client.patch(self.url, data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(Thing.objects.filter(pk__in=[1, 2]).values_list('title', flat=True)), ['first', 'second'])
+        self.assertEqual(list(Thing.objects.get(pk=1).other_things.values_list('pk', flat=True)), self.other_things[:1])
+
+        response = self.client.put(self.url, [{'id': 3, 'title': 'third'}, {'id': 99, 'title': 'x'}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()[0], {})
+        self.assertIn('id', response.json()[1])
+        self.assertNotEqual(Thing.objects.get(pk=3).title, 'third')
+
+        response = self.client.put(self.url, [{'id': 3}, {'id': 4, 'title': 'x'}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('title', response.json()[0])
+        self.assertEqual(response.json()[1], {})
+
+    def test_update_auto_now(self):
+        instance = AnotherThing.objects.create(title='first')
+        AnotherThing.objects.filter(pk=instance.pk).update(modified_at=None)
+        instance.refresh_from_db()
+
+        serializer = AnotherThingShortSerializer(instance, data={'title': 'changed'}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        views.BaseBulkModelMixin().perform_bulk_update([serializer])
+
+        instance.refresh_from_db()
+        self.assertEqual(instance.title, 'changed')
+        self.assertIsNotNone(instance.modified_at)
+
+    def test_destroy(self):
+        response = self.client.delete(self.url, [1, {'id': 2}], format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(list(Thing.objects.values_list('pk', flat=True)), [3, 4, 5])
+        self.assertEqual(Thing.all_objects.count(), 5)
+
+        response = self.client.delete(self.url, [3, 3], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Thing.objects.count(), 3)
+
+
+class SparseFieldsTestCase(TestCase):
+    fixtures = ['tests/fixtures.json']
+    client_class = APIClient
+
+    def setUp(self):
+        another_thing = AnotherThing.objects.create(title='another')
+        Thing.objects.update(another_thing=another_thing)
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), [query['sql'] for query in queries]
+
+    def test_fields(self):
+        data, queries = self.get(reverse('things-sparse-list'), fields='id')
+        self.assertEqual(data[0], {'id': 1})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('another_things', queries[0])
+        self.assertNotIn('"things"."title"', queries[0])
+
+        data, queries = self.get(reverse('things-sparse-detail', args=[1]), fields='id,another_thing.title')
+        self.assertEqual(data, {'id': 1, 'another_thing': {'title': 'another'}})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"another_things"."modified_at"', queries[0])
+
+    def test_omit(self):
+        data, queries = self.get(reverse('things-sparse-list'), omit='other_things,another_thing.id')
+        self.assertEqual(data[0], {'id': 1, 'another_thing': {'title': 'another'}})
+        self.assertEqual(len(queries), 1)
+
+        data, queries = self.get(reverse('things-sparse-list'))
+        self.assertEqual(set(data[0]), {'id', 'another_thing', 'other_things'})
+        self.assertEqual(len(queries), 2)
+
+
+class WriteDisplayTestCase(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        self.other_things = [
+            OtherThing.objects.create(title=f'other {index}', another_thing=AnotherThing.objects.create(title='a'))
+            for index in range(10)
+        ]
+        self.data = {'title': 'new', 'other_things': [other_thing.pk for other_thing in self.other_things]}
+
+    def test_reload(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('things-reload-list'), self.data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), json.loads(json.dumps(
+            ThingOtherThingsSerializer(Thing.objects.get(pk=response.json()['id'])).data
+        )))
+        reloaded = len(queries)
+
+        with mock.patch.object(ThingReloadViewSet, 'display_reload', False):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(reverse('things-reload-list'), self.data, format='json')
+        self.assertEqual(len(queries) - reloaded, len(self.other_things) - 2)
+
+    def test_reuse(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('things-reuse-list'), self.data, format='json')
+        self.assertEqual(response.json()['other_things'], self.data['other_things'])
+        reused = len(queries)
+
+        with mock.patch.object(ThingReuseViewSet, 'display_reuse', False):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(reverse('things-reuse-list'), self.data, format='json')
+        self.assertEqual(len(queries) - reused, 1)
+
+        url = reverse('things-reuse-detail', args=[response.json()['id']])
+        response = self.client.patch(url, {'other_things': self.data['other_things'][:2]}, format='json')
+        self.assertEqual(response.json()['other_things'], self.data['other_things'][:2])
+        self.assertEqual(self.client.get(url).json()['other_things'], self.data['other_things'][:2])
+
+
+class AsyncPermission(BasePermission):
+    async def has_permission(self, request, view):
+        return request.method != 'DELETE'
+
+
+class AsyncViewSetTestCase(TestCase):
+    fixtures = ['tests/fixtures.json']
+    client_class = APIClient
+
+    def test_view(self):
+        self.assertTrue(asyncio.iscoroutinefunction(ThingAsyncViewSet.as_view({'get': 'list'})))
+
+    def test_read(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('things-async-list'))
+        self.assertEqual(response.json(), json.loads(json.dumps(
+            ThingDetailSerializer(Thing.objects.all(), many=True).data
+        )))
+
+        response = self.client.get(reverse('things-async-detail', args=[1]))
+        self.assertEqual(response.json(), {'id': 1, 'another_thing': None, 'other_things': []})
+        self.assertEqual(self.client.get(reverse('things-async-detail', args=[99])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('things-async-detail', args=['x'])).status_code, 404)
+
+    async def test_async_client(self):
+        response = await self.async_client.get(reverse('things-async-list'))
+        self.assertEqual([item['id'] for item in response.json()], [1, 2, 3, 4, 5])
+
+        response = await self.async_client.get(reverse('things-async-detail', args=[2]))
+        self.assertEqual(response.json()['id'], 2)
+
+    def test_write(self):
+        response = self.client.post(reverse('things-async-list'), {'title': 'new'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        url = reverse('things-async-detail', args=[response.json()['id']])
+
+        response = self.client.patch(url, {'title': 'changed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Thing.objects.filter(title='changed').exists())
+
+        response = self.client.post(reverse('things-async-list'), {}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertFalse(Thing.objects.filter(title='changed').exists())
+
+    def test_cache(self):
+        cache.clear()
+        url = reverse('things-async-cached-list')
+        self.assertEqual(len(self.client.get(url).json()), 5)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.client.get(url).json()), 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'title': 'new'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self.client.get(url).json()), 6)
+
+        detail = reverse('things-async-cached-detail', args=[response.json()['id']])
+        self.assertEqual(self.client.get(detail).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(detail).status_code, 204)
+        self.assertEqual(self.client.get(detail).status_code, 404)
+
+    @staticmethod
+    async def acommit(request):
+        """
+        Await the request and run the on_commit callbacks it scheduled, they are registered on the connection of
+        the sync thread which captureOnCommitCallbacks doesn't see from the event loop
+        """
+        start = await sync_to_async(lambda: len(connection.run_on_commit))()
+        response = await request
+        callbacks = await sync_to_async(lambda: connection.run_on_commit[start:])()
+        for _, callback, _ in callbacks:
+            await sync_to_async(callback)()
+        return response
+
+    async def test_async_client_cache(self):
+        await cache.aclear()
+        url = reverse('things-async-cached-list')
+        self.assertEqual(len((await self.async_client.get(url)).json()), 5)
+
+        # writes outside the views are not seen until the generation changes
+        await Thing.objects.acreate(title='new')
+        self.assertEqual(len((await self.async_client.get(url)).json()), 5)
+
+        response = await self.acommit(
+            self.async_client.post(url, {'title': 'other'}, content_type='application/json')
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len((await self.async_client.get(url)).json()), 7)
+
+        detail = reverse('things-async-cached-detail', args=[response.json()['id']])
+        self.assertIsNone((await self.async_client.get(detail)).json()['another_thing'])
+        another_thing = await AnotherThing.objects.acreate(title='first')
+        await self.acommit(
+            self.async_client.patch(detail, {'another_thing': another_thing.pk}, content_type='application/json')
+        )
+        self.assertEqual((await self.async_client.get(detail)).json()['another_thing']['id'], another_thing.pk)
+
+        await self.acommit(self.async_client.delete(detail))
+        self.assertEqual((await self.async_client.get(detail)).status_code, 404)
+        self.assertEqual(len((await self.async_client.get(url)).json()), 6)
+
+    async def test_async_stream(self):
+        with mock.patch.object(ThingAsyncViewSet, 'list_stream', True), \
+                mock.patch.object(ThingAsyncViewSet, 'list_stream_chunk_size', 2):
+            response = await self.async_client.get(reverse('things-async-list'))
+            self.assertTrue(response.streaming)
+            content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual([item['id'] for item in json.loads(content)], [1, 2, 3, 4, 5])
+
+    async def test_create_return_instance(self):
+        view = ThingAsyncViewSet(action='create', action_map={'post': 'create'}, kwargs={}, format_kwarg=None)
+        view.request = view.initialize_request(APIRequestFactory().post('/', {'title': 'new'}, format='json'))
+        instance = await view.create(view.request, return_instance=True)
+        self.assertIsInstance(instance, Thing)
+        self.assertEqual(instance.title, 'new')
+
+    def test_async_permission(self):
+        with mock.patch.object(ThingAsyncViewSet, 'permission_classes_by_action', {'default': [AsyncPermission]}):
+            ThingAsyncViewSet.reset_action_resolution()
+            self.assertEqual(self.client.get(reverse('things-async-list')).status_code, 200)
+            self.assertEqual(self.client.delete(reverse('things-async-detail', args=[1])).status_code, 403)
+        ThingAsyncViewSet.reset_action_resolution()
+
+
 class ThingViewCRUDTestCase(CRUDTestCase, TestCase):
     fixtures = ['tests/fixtures.json']
     base_view = 'things'
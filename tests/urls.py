@@ -3,7 +3,17 @@ from rest_framework.routers import DefaultRouter
 from drf_util.utils import get_custom_schema_view
 from tests.view import (
     ThingViewSet,
-    ThingRelatedViewSet
+    ThingRelatedViewSet,
+    ThingStreamViewSet,
+    ThingCursorViewSet,
+    AnotherThingViewSet,
+    AnotherThingCachedViewSet,
+    ThingBulkViewSet,
+    ThingSparseViewSet,
+    ThingReloadViewSet,
+    ThingReuseViewSet,
+    ThingAsyncViewSet,
+    ThingAsyncCachedViewSet
 )
 
 schema_view = get_custom_schema_view(
@@ -13,6 +23,16 @@ schema_view = get_custom_schema_view(
 router = DefaultRouter()
 router.register('things', ThingViewSet, basename='things')
 router.register('things-related', ThingRelatedViewSet, basename='things-related')
+router.register('things-stream', ThingStreamViewSet, basename='things-stream')
+router.register('things-cursor', ThingCursorViewSet, basename='things-cursor')
+router.register('another-things', AnotherThingViewSet, basename='another-things')
+router.register('another-things-cached', AnotherThingCachedViewSet, basename='another-things-cached')
+router.register('things-bulk', ThingBulkViewSet, basename='things-bulk')
+router.register('things-sparse', ThingSparseViewSet, basename='things-sparse')
+router.register('things-reload', ThingReloadViewSet, basename='things-reload')
+router.register('things-reuse', ThingReuseViewSet, basename='things-reuse')
+router.register('things-async', ThingAsyncViewSet, basename='things-async')
+router.register('things-async-cached', ThingAsyncCachedViewSet, basename='things-async-cached')
 
 urlpatterns = [
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
@@ -1,6 +1,9 @@
-from drf_util.views import BaseModelViewSet
-from tests.models import Thing
-from tests.serializers import ThingSerializer
+from drf_util.pagination import CustomCursorPagination
+from drf_util.views import AsyncModelViewSet, BaseModelViewSet, BaseBulkModelViewSet
+from tests.models import Thing, AnotherThing
+from tests.serializers import (
+    ThingSerializer, ThingDetailSerializer, AnotherThingShortSerializer, ThingOtherThingsSerializer
+)
 
 
 class ThingViewSet(BaseModelViewSet):
@@ -27,3 +30,66 @@ class ThingRelatedViewSet(BaseModelViewSet):
         'other_things',
         'other_things__another_thing'
     )
+
+
+class ThingStreamViewSet(BaseModelViewSet):
+    queryset = Thing.objects.all()
+    serializer_class = ThingDetailSerializer
+    list_stream = True
+    list_stream_chunk_size = 2
+
+
+class ThingCursorViewSet(BaseModelViewSet):
+    queryset = Thing.objects.all()
+    serializer_class = ThingSerializer
+    pagination_class = CustomCursorPagination
+    ordering = ['-title']
+
+
+class AnotherThingViewSet(BaseModelViewSet):
+    queryset = AnotherThing.objects.all()
+    serializer_class = AnotherThingShortSerializer
+    conditional_requests = True
+
+
+class AnotherThingCachedViewSet(BaseModelViewSet):
+    queryset = AnotherThing.objects.all()
+    serializer_class = AnotherThingShortSerializer
+    response_cache = True
+
+
+class ThingBulkViewSet(BaseBulkModelViewSet):
+    queryset = Thing.objects.all()
+    serializer_class = ThingSerializer
+    bulk_max_batch_size = 10
+
+
+class ThingSparseViewSet(BaseModelViewSet):
+    queryset = Thing.objects.all()
+    serializer_class = ThingDetailSerializer
+    sparse_fields = True
+    autocomplete_related_deep = 2
+
+
+class ThingReloadViewSet(BaseModelViewSet):
+    queryset = Thing.objects.all()
+    serializer_class = ThingOtherThingsSerializer
+    serializer_create_class = ThingSerializer
+    autocomplete_related_deep = 3
+    display_reload = True
+
+
+class ThingReuseViewSet(BaseModelViewSet):
+    queryset = Thing.objects.all()
+    serializer_class = ThingSerializer
+    display_reuse = True
+
+
+class ThingAsyncViewSet(AsyncModelViewSet):
+    queryset = Thing.objects.all()
+    serializer_class = ThingDetailSerializer
+    serializer_create_class = ThingSerializer
+
+
+class ThingAsyncCachedViewSet(ThingAsyncViewSet):
+    response_cache = True